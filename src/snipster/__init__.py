@@ -0,0 +1,4 @@
+def main():
+    from snipster.cli import app
+
+    app()
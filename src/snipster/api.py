@@ -1,24 +1,220 @@
-from fastapi import Depends, FastAPI, Query
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Literal
+
+from decouple import config
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from sqlmodel import Session
 
-from snipster.models import Language, Snippet, SnippetCreate, SnippetPublic, get_session
-from snipster.repo import DatastoreRepository
+from snipster.batching import close_write_batcher, get_write_batcher
+from snipster.cache import shared_cache, with_cache
+from snipster.conditional import (
+    body_etag,
+    etag_matches,
+    http_date,
+    not_modified,
+    snippet_etag,
+)
+from snipster.dedup import DUPLICATE_POLICY
+from snipster.exceptions import (
+    DuplicateSnippet,
+    InvalidCursor,
+    SnippetNotFound,
+    VersionConflict,
+)
+from snipster.metrics import finish_request, registry, start_request
+from snipster.models import (
+    ChangeFeed,
+    DuplicateGroup,
+    Language,
+    SimilarSnippet,
+    Snippet,
+    SnippetBatch,
+    SnippetCreate,
+    SnippetPublic,
+    TagCount,
+    dispose_async_engine,
+    dispose_engine,
+    get_async_engine,
+    get_async_session,
+    get_engine,
+    get_session,
+    pool_status,
+)
+from snipster.repo import AsyncDatastoreRepository, DatastoreRepository
+from snipster.serialization import dumps
+from snipster.similarity import DEFAULT_THRESHOLD
+from snipster.transfer import import_snippets, read_records, to_ndjson
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SNIPPET_FIELDS = list(SnippetPublic.model_fields)
+DuplicatePolicy = Literal["allow", "reject", "link"]
+SortOrder = Literal[
+    "id", "-id", "created_at", "-created_at", "updated_at", "-updated_at"
+]
+CHANGE_POLL_INTERVAL = config("CHANGE_POLL_INTERVAL", default=1.0, cast=float)
+CHANGE_HEARTBEAT = config("CHANGE_HEARTBEAT", default=15.0, cast=float)
+
+
+class SnippetJSONResponse(Response):
+    """JSON response rendered with orjson.
+
+    Routes wrap repository rows in this response and return it directly, so
+    FastAPI skips re-validating trusted rows against the response model.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
 
 
 def get_repo():
     session_gen = get_session()
     session = next(session_gen)
     try:
-        yield DatastoreRepository(session)
+        yield with_cache(DatastoreRepository(session))
     finally:
         session_gen.close()
 
 
-app = FastAPI()
+def get_columns(
+    fields: str | None = Query(
+        None, description="Comma-separated snippet fields to return"
+    ),
+):
+    if fields is None:
+        return None
+    columns = list(dict.fromkeys(["id", *fields.split(",")]))
+    unknown = [column for column in columns if column not in SNIPPET_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return columns
+
+
+async def get_async_repo():
+    async for session in get_async_session():
+        yield AsyncDatastoreRepository(
+            session, wrap=with_cache, batcher=get_write_batcher()
+        )
+
+
+async def check_if_match(
+    snippet_id: int,
+    if_match: str | None = Header(None),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    """Check If-Match and return the version the mutation must still find.
+
+    The mutation re-checks that version in its own UPDATE, so a write that
+    lands between this read and the mutation still fails with 412.
+    """
+    if if_match is None:
+        return None
+    updated_at = await repo.get_version(snippet_id)
+    if updated_at is None or not etag_matches(
+        if_match, snippet_etag(snippet_id, updated_at), weak=False
+    ):
+        raise HTTPException(status_code=412, detail="Precondition failed")
+    return updated_at
+
+
+async def precondition(mutation):
+    try:
+        return await mutation
+    except VersionConflict:
+        raise HTTPException(status_code=412, detail="Precondition failed")
+
+
+def conditional_response(request, content, headers=None):
+    """Render ``content`` with a body-hash ETag, or 304 if the client has it.
+
+    No Last-Modified: deletes leave the newest ``updated_at`` unchanged, so
+    only the body hash tracks a collection's changes.
+    """
+    body = dumps(content)
+    etag = body_etag(body)
+    headers = {**(headers or {}), "ETag": etag}
+    if not_modified(request.headers, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_engine()
+    get_async_engine()
+    yield
+    close_write_batcher()
+    dispose_engine()
+    await dispose_async_engine()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=SnippetJSONResponse)
+registry.gauges("snipster_db_pool", "Database connection pool state", pool_status)
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    stats, token = start_request()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template rather than raw path to bound cardinality.
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        finish_request(
+            token,
+            stats,
+            request.method,
+            route,
+            status,
+            time.perf_counter() - started,
+        )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health/pool", response_model=dict, status_code=200)
+def get_pool_status():
+    return pool_status()
+
+
+@app.get("/health/cache", response_model=dict, status_code=200)
+def get_cache_status():
+    return shared_cache.stats()
+
+
+@app.get("/health/batcher", response_model=dict, status_code=200)
+def get_batcher_status():
+    batcher = get_write_batcher()
+    return batcher.stats() if batcher is not None else {"enabled": False}
 
 
 @app.post("/snippets/", response_model=SnippetPublic, status_code=201)
-def create_snippet(snippet: SnippetCreate, repo: Session = Depends(get_repo)):
+async def create_snippet(
+    snippet: SnippetCreate,
+    on_duplicate: DuplicatePolicy | None = None,
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    """Create a snippet, applying the duplicate-code policy.
+
+    ``reject`` answers 409 when another snippet has the same code; ``link``
+    answers 200 with that snippet instead of storing a copy.
+    """
+    policy = on_duplicate or DUPLICATE_POLICY
     db_snippet = Snippet(
         title=snippet.title,
         code=snippet.code,
@@ -27,40 +223,256 @@ def create_snippet(snippet: SnippetCreate, repo: Session = Depends(get_repo)):
         tags=snippet.tags,
         favorite=snippet.favorite,
     )
-    repo.add(db_snippet)
-    return db_snippet.model_dump()
+    try:
+        await repo.add(
+            db_snippet, on_duplicate="allow" if policy == "allow" else "reject"
+        )
+    except DuplicateSnippet as error:
+        if policy == "reject":
+            raise HTTPException(status_code=409, detail=error.message)
+        existing = await repo.get(error.snippet_id)
+        return SnippetJSONResponse(existing, status_code=200)
+    return SnippetJSONResponse(db_snippet.model_dump(), status_code=201)
+
+
+@app.post("/snippets/bulk", response_model=dict, status_code=200)
+async def bulk_create_snippets(
+    request: Request, repo: AsyncDatastoreRepository = Depends(get_async_repo)
+):
+    body = await request.body()
+    records = read_records(body.decode().splitlines(keepends=True))
+    return SnippetJSONResponse(await repo.run(import_snippets, records))
 
 
 @app.get("/snippets/", response_model=list[SnippetPublic], status_code=200)
-def get_snippets(repo: Session = Depends(get_repo)):
-    snippets = repo.all()
-    return snippets
+async def get_snippets(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    tag: list[str] = Query(None),
+    match: Literal["all", "any"] = "all",
+    language: Language | None = None,
+    favorite: bool | None = None,
+    created_after: datetime | None = None,
+    updated_after: datetime | None = None,
+    sort: SortOrder = "id",
+    columns: list[str] | None = Depends(get_columns),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    try:
+        snippets, next_cursor = await repo.page(
+            limit,
+            cursor=cursor,
+            tags=tag,
+            match=match,
+            columns=columns,
+            language=language,
+            favorite=favorite,
+            created_after=created_after,
+            updated_after=updated_after,
+            sort=sort,
+        )
+    except InvalidCursor as error:
+        raise HTTPException(status_code=400, detail=error.message)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else {}
+    return conditional_response(request, snippets, headers=headers)
+
+
+async def change_events(
+    repo, since, is_disconnected, poll_interval=CHANGE_POLL_INTERVAL
+):
+    """Yield server-sent events for changes after ``since`` until disconnect.
+
+    The connection is released after every poll, so an open stream does not
+    pin a pooled connection (idle in transaction) for its whole lifetime.
+    """
+    idle = 0.0
+    while not await is_disconnected():
+        changes = await repo.changes(since=since, limit=MAX_PAGE_SIZE)
+        await repo.release()
+        for change in changes:
+            data = dumps(change).decode()
+            yield f"id: {change['seq']}\nevent: {change['op']}\ndata: {data}\n\n"
+        if changes:
+            since, idle = changes[-1]["seq"], 0.0
+            continue
+        if idle >= CHANGE_HEARTBEAT:
+            yield ": keepalive\n\n"
+            idle = 0.0
+        await asyncio.sleep(poll_interval)
+        idle += poll_interval
+
+
+@app.get("/snippets/changes", response_model=ChangeFeed, status_code=200)
+async def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    changes = await repo.changes(since=since, limit=limit)
+    last_seq = changes[-1]["seq"] if changes else since
+    return SnippetJSONResponse({"changes": changes, "last_seq": last_seq})
+
+
+@app.get("/snippets/changes/stream", status_code=200)
+async def stream_changes(
+    request: Request,
+    since: int | None = Query(None, ge=0),
+    last_event_id: int | None = Header(None),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    # Reconnecting EventSource clients resume from Last-Event-ID.
+    if since is None:
+        since = last_event_id or 0
+    return StreamingResponse(
+        change_events(repo, since, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/snippets/export", status_code=200)
+def export_snippets(repo: Session = Depends(get_repo)):
+    return StreamingResponse(
+        to_ndjson(repo.stream()), media_type="application/x-ndjson"
+    )
+
+
+@app.get("/snippets/batch", response_model=SnippetBatch, status_code=200)
+async def get_snippet_batch(
+    request: Request,
+    ids: str = Query(..., pattern=r"^\d+(,\d+)*$"),
+    columns: list[str] | None = Depends(get_columns),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    snippet_ids = [int(id) for id in ids.split(",")]
+    if len(snippet_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per request"
+        )
+    items, missing = await repo.get_many(snippet_ids, columns=columns)
+    return conditional_response(request, {"items": items, "missing": missing})
+
+
+@app.get("/snippets/duplicates", response_model=list[DuplicateGroup], status_code=200)
+async def get_duplicates(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    return conditional_response(request, await repo.duplicates(limit=limit))
+
+
+@app.get("/snippets/search", response_model=list[SnippetPublic], status_code=200)
+async def search_snippets(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    return conditional_response(request, await repo.search(q, limit, offset=offset))
 
 
 @app.get("/snippets/{snippet_id}", response_model=SnippetPublic, status_code=200)
-def get_snippet(snippet_id: int, repo: Session = Depends(get_repo)):
-    snippet = repo.get(snippet_id)
-    return snippet
+async def get_snippet(
+    request: Request,
+    snippet_id: int,
+    columns: list[str] | None = Depends(get_columns),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    # Answer revalidation from the updated_at column alone; the row is only
+    # fetched when the client's copy is stale.
+    updated_at = await repo.get_version(snippet_id)
+    snippet = None
+    if updated_at is not None:
+        etag = snippet_etag(snippet_id, updated_at, columns)
+        if not_modified(request.headers, etag, updated_at):
+            headers = {"ETag": etag, "Last-Modified": http_date(updated_at)}
+            return Response(status_code=304, headers=headers)
+        fields = columns
+        if columns is not None and "updated_at" not in columns:
+            fields = [*columns, "updated_at"]
+        snippet = await repo.get(snippet_id, columns=fields)
+    if snippet is None:
+        raise HTTPException(
+            status_code=404, detail=f"Snippet ID: {snippet_id} not found"
+        )
+    # Tag the row actually returned: a cached copy can trail get_version()
+    # until its invalidation lands, and must not be sent under a newer ETag.
+    updated_at = snippet["updated_at"]
+    if fields is not columns:
+        snippet = {key: value for key, value in snippet.items() if key in columns}
+    headers = {
+        "ETag": snippet_etag(snippet_id, updated_at, columns),
+        "Last-Modified": http_date(updated_at),
+    }
+    return SnippetJSONResponse(snippet, headers=headers)
+
+
+@app.get(
+    "/snippets/{snippet_id}/similar",
+    response_model=list[SimilarSnippet],
+    status_code=200,
+)
+async def get_similar_snippets(
+    request: Request,
+    snippet_id: int,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    threshold: float = Query(DEFAULT_THRESHOLD, ge=0, le=1),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    try:
+        similar = await repo.similar(snippet_id, limit=limit, threshold=threshold)
+    except SnippetNotFound as error:
+        raise HTTPException(status_code=404, detail=error.message)
+    return conditional_response(request, similar)
 
 
 @app.delete("/snippets/{snippet_id}")
-def delete_snippet(snippet_id: int, repo: Session = Depends(get_repo)):
-    result = repo.delete(snippet_id)
+async def delete_snippet(
+    snippet_id: int,
+    expected_version: datetime | None = Depends(check_if_match),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    result = await precondition(
+        repo.delete(snippet_id, expected_version=expected_version)
+    )
     return {"message": result}
 
 
 @app.post("/snippets/{snippet_id}/favorite", response_model=dict)
-def toggle_favorite(snippet_id: int, repo: Session = Depends(get_repo)):
-    result = repo.toggle_favorite(snippet_id)
+async def toggle_favorite(
+    snippet_id: int,
+    expected_version: datetime | None = Depends(check_if_match),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
+):
+    result = await precondition(
+        repo.toggle_favorite(snippet_id, expected_version=expected_version)
+    )
     return {"message": result}
 
 
 @app.post("/snippets/{snippet_id}/tags", response_model=dict)
-def update_tags(
+async def update_tags(
     snippet_id: int,
     tags: list[str] = Query(...),
     remove: bool = False,
-    repo: Session = Depends(get_repo),
+    expected_version: datetime | None = Depends(check_if_match),
+    repo: AsyncDatastoreRepository = Depends(get_async_repo),
 ):
-    result = repo.tag(snippet_id, ", ".join(tags), remove=remove)
-    return {"message": result}
+    return await precondition(
+        repo.update_tags(
+            snippet_id,
+            ", ".join(tags),
+            remove=remove,
+            expected_version=expected_version,
+        )
+    )
+
+
+@app.get("/tags/", response_model=list[TagCount], status_code=200)
+async def get_tag_counts(
+    request: Request, repo: AsyncDatastoreRepository = Depends(get_async_repo)
+):
+    return conditional_response(request, await repo.tag_counts())
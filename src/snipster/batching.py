@@ -0,0 +1,135 @@
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread
+
+from decouple import config
+from sqlmodel import Session
+
+from snipster.cache import CachedRepository, with_cache
+from snipster.models import get_engine
+from snipster.repo import DatastoreRepository
+
+WRITE_BATCH_ENABLED = config("WRITE_BATCH_ENABLED", default=False, cast=bool)
+WRITE_BATCH_MAX_DELAY = config("WRITE_BATCH_MAX_DELAY", default=0.005, cast=float)
+WRITE_BATCH_MAX_SIZE = config("WRITE_BATCH_MAX_SIZE", default=500, cast=int)
+
+_STOP = object()
+
+_batcher = None
+
+
+class WriteBatcher:
+    """Write-behind queue that group-commits DatastoreRepository mutations.
+
+    ``submit`` returns a Future right away. A worker thread collects
+    submissions for up to ``max_delay`` seconds or ``max_size`` calls, runs
+    each one inside its own savepoint and commits the batch once, so a
+    failing call only rolls back its own changes. Futures resolve after the
+    commit, with the call's result or the error it raised. A ``wrap`` that
+    returns a deferred CachedRepository is invalidated only after the commit.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_delay=WRITE_BATCH_MAX_DELAY,
+        max_size=WRITE_BATCH_MAX_SIZE,
+        wrap=None,
+    ):
+        self.session_factory = session_factory
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self.wrap = wrap or (lambda repository: repository)
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        self.thread = Thread(target=self._run, name="snipster-write-batcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, method, *args, **kwargs):
+        future = Future()
+        self.queue.put((future, method, args, kwargs))
+        return future
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "pending": self.queue.qsize(),
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            batch, stopping = self._collect(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        done = []
+        with self.session_factory() as session:
+            repository = self.wrap(DatastoreRepository(session, autocommit=False))
+            for future, method, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with session.begin_nested():
+                        result = getattr(repository, method)(*args, **kwargs)
+                # Repository errors derive from BaseException.
+                except BaseException as error:
+                    future.set_exception(error)
+                else:
+                    done.append((future, result))
+            try:
+                session.commit()
+            except Exception as error:
+                for future, _ in done:
+                    future.set_exception(error)
+                return
+        if isinstance(repository, CachedRepository):
+            repository.flush_invalidations()
+        self.batches += 1
+        self.writes += len(done)
+        for future, result in done:
+            future.set_result(result)
+
+
+def get_write_batcher():
+    global _batcher
+    if WRITE_BATCH_ENABLED and _batcher is None:
+        _batcher = WriteBatcher(
+            lambda: Session(get_engine(), expire_on_commit=False),
+            wrap=lambda repository: with_cache(repository, deferred=True),
+        )
+    return _batcher
+
+
+def close_write_batcher():
+    global _batcher
+    if _batcher is not None:
+        _batcher.close()
+        _batcher = None
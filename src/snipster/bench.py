@@ -0,0 +1,321 @@
+"""Throughput and latency benchmarks for the repositories, API and CLI.
+
+Run with ``python -m snipster.bench --size 1000 --output results.json`` and
+pass ``--compare`` an earlier results file to print the change per
+benchmark. Every backend works on its own temporary SQLite or JSON file, so
+``DATABASE_URL`` only has to be importable, not populated.
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from snipster.models import Language, Snippet
+from snipster.repo import (
+    DatastoreRepository,
+    InMemoryRepository,
+    JournaledJSONRepository,
+    JSONRepository,
+)
+
+BACKENDS = ["memory", "json", "journal", "mmap", "sqlite", "api", "cli"]
+WORDS = (
+    "parse load cache index query token stream batch retry merge sort filter "
+    "render async socket buffer schema encode decode config client server"
+).split()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def measure(name, operation, inputs, ok=None):
+    """Time ``operation`` over ``inputs``.
+
+    Results that ``ok`` rejects are counted as errors, so a benchmark of
+    failing requests does not pass for a fast one.
+    """
+    samples = []
+    errors = 0
+    started = time.perf_counter()
+    for item in inputs:
+        begin = time.perf_counter_ns()
+        result = operation(item)
+        samples.append(time.perf_counter_ns() - begin)
+        if ok is not None and not ok(result):
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "name": name,
+        "ops": len(samples),
+        "errors": errors,
+        "ops_per_sec": round(len(samples) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(samples, 50) / 1e6, 4),
+        "p99_ms": round(percentile(samples, 99) / 1e6, 4),
+    }
+
+
+def make_corpus(size, seed=0):
+    rng = random.Random(seed)
+    languages = list(Language)
+    corpus = []
+    for id in range(1, size + 1):
+        words = rng.sample(WORDS, 6)
+        corpus.append(
+            {
+                "id": id,
+                "title": " ".join(words[:3]),
+                "code": f"def {words[0]}_{id}():\n    return {words[1]!r}\n",
+                "description": " ".join(words[3:]),
+                "language": rng.choice(languages),
+                "tags": ", ".join(rng.sample(WORDS, 2)),
+                "favorite": rng.random() < 0.2,
+            }
+        )
+    return corpus
+
+
+def _snippets(corpus):
+    return [Snippet(**values) for values in corpus]
+
+
+def bench_repository(backend, repo, corpus, key=int):
+    ids = [key(values["id"]) for values in corpus]
+    sample = random.Random(1).choices(ids, k=len(ids))
+    results = [
+        measure("add", repo.add, _snippets(corpus)),
+        measure("get", repo.get, sample),
+        measure("page", lambda _: repo.page(100), range(max(1, len(ids) // 100))),
+        measure("all", lambda _: repo.all(), range(3)),
+        measure("search", lambda word: repo.search(word, 20), WORDS),
+        measure("similar", lambda id: repo.similar(id, 10), sample[:100]),
+        measure("tag", lambda id: repo.update_tags(id, "bench"), ids),
+        measure("toggle", repo.toggle_favorite, ids),
+        measure("delete", repo.delete, ids),
+    ]
+    return [{"backend": backend, **result} for result in results]
+
+
+def _sqlite_engine(directory):
+    engine = create_engine(f"sqlite:///{directory}/bench.db")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+@contextmanager
+def _backend(name, directory):
+    directory = Path(directory)
+    if name == "memory":
+        yield InMemoryRepository(), str
+    elif name in ("json", "journal"):
+        path = directory / f"{name}.json"
+        path.write_text("{}")
+        factory = JSONRepository if name == "json" else JournaledJSONRepository
+        with factory(path) as repo:
+            yield repo, str
+    elif name == "mmap":
+        from snipster.mmap_repo import MmapRepository
+
+        with MmapRepository(directory / "snippets") as repo:
+            yield repo, int
+    elif name == "sqlite":
+        with Session(_sqlite_engine(directory)) as session:
+            yield DatastoreRepository(session), int
+
+
+def _response_ok(response):
+    return response.is_success
+
+
+def _exit_ok(result):
+    return result.exit_code == 0
+
+
+def bench_api(corpus, directory):
+    from fastapi.testclient import TestClient
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from snipster.api import app, get_async_repo, get_repo
+    from snipster.repo import AsyncDatastoreRepository
+
+    engine = _sqlite_engine(directory)
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{directory}/bench.db", poolclass=NullPool
+    )
+
+    def override_repo():
+        with Session(engine) as session:
+            yield DatastoreRepository(session)
+
+    async def override_async_repo():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield AsyncDatastoreRepository(session)
+
+    app.dependency_overrides[get_repo] = override_repo
+    app.dependency_overrides[get_async_repo] = override_async_repo
+    payloads = [
+        {**values, "id": None, "language": values["language"].value}
+        for values in corpus
+    ]
+    ids = [values["id"] for values in corpus]
+    try:
+        client = TestClient(app)
+        results = [
+            measure(
+                "POST /snippets/",
+                lambda p: client.post("/snippets/", json=p),
+                payloads,
+                ok=_response_ok,
+            ),
+            measure(
+                "GET /snippets/{id}",
+                lambda id: client.get(f"/snippets/{id}"),
+                ids,
+                ok=_response_ok,
+            ),
+            measure(
+                "GET /snippets/",
+                lambda _: client.get("/snippets/?limit=100"),
+                range(max(1, len(ids) // 100)),
+                ok=_response_ok,
+            ),
+            measure(
+                "POST /snippets/{id}/favorite",
+                lambda id: client.post(f"/snippets/{id}/favorite"),
+                ids,
+                ok=_response_ok,
+            ),
+            measure(
+                "DELETE /snippets/{id}",
+                lambda id: client.delete(f"/snippets/{id}"),
+                ids,
+                ok=_response_ok,
+            ),
+        ]
+    finally:
+        app.dependency_overrides.clear()
+    return [{"backend": "api", **result} for result in results]
+
+
+def bench_cli(corpus, directory):
+    from typer.testing import CliRunner
+
+    from snipster.cli import app
+
+    runner = CliRunner()
+    with Session(_sqlite_engine(directory)) as session:
+        repo = DatastoreRepository(session)
+        for snippet in _snippets(corpus):
+            repo.add(snippet)
+        ids = [values["id"] for values in corpus]
+
+        def invoke(*args):
+            return runner.invoke(app, [str(arg) for arg in args], obj=repo)
+
+        results = [
+            measure("get", lambda id: invoke("get", "--id", id), ids, ok=_exit_ok),
+            measure(
+                "favorite",
+                lambda id: invoke("favorite", "--id", id),
+                ids,
+                ok=_exit_ok,
+            ),
+            measure(
+                "all", lambda _: invoke("all", "--limit", 100), range(3), ok=_exit_ok
+            ),
+        ]
+    return [{"backend": "cli", **result} for result in results]
+
+
+def _commit():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def run(backends, size, seed=0):
+    corpus = make_corpus(size, seed)
+    results = []
+    for backend in backends:
+        with tempfile.TemporaryDirectory() as directory:
+            if backend == "api":
+                results.extend(bench_api(corpus, directory))
+            elif backend == "cli":
+                results.extend(bench_cli(corpus, directory))
+            else:
+                with _backend(backend, directory) as (repo, key):
+                    results.extend(bench_repository(backend, repo, corpus, key))
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "size": size,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    previous = {
+        (result["backend"], result["name"]): result for result in baseline["results"]
+    }
+    lines = []
+    for result in report["results"]:
+        before = previous.get((result["backend"], result["name"]))
+        if before is None or not before["ops_per_sec"]:
+            continue
+        change = result["ops_per_sec"] / before["ops_per_sec"] - 1
+        lines.append(f"{result['backend']:8} {result['name']:30} {change:+.1%}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000, help="Snippets per corpus")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    parser.add_argument(
+        "--backend",
+        action="append",
+        choices=BACKENDS,
+        help="Backend to run; repeat for several (default: all)",
+    )
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+    parser.add_argument("--compare", type=Path, help="Earlier JSON report")
+    args = parser.parse_args(argv)
+
+    report = run(args.backend or BACKENDS, args.size, args.seed)
+    for result in report["results"]:
+        print(
+            f"{result['backend']:8} {result['name']:30} "
+            f"{result['ops_per_sec']:>12} ops/s  "
+            f"p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms"
+            + (f"  {result['errors']} errors" if result["errors"] else "")
+        )
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.compare is not None:
+        print("\n".join(compare(report, json.loads(args.compare.read_text()))))
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,319 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from decouple import config
+
+from snipster.repo import SnippetRepository, project
+from snipster.similarity import DEFAULT_THRESHOLD
+
+CACHE_ENABLED = config("CACHE_ENABLED", default=False, cast=bool)
+CACHE_MAX_SIZE = config("CACHE_MAX_SIZE", default=10000, cast=int)
+CACHE_TTL = config("CACHE_TTL", default=60.0, cast=float)
+
+_MISSING = object()
+
+LISTINGS = ("all", "page", "search", "tag_counts", "duplicates", "similar")
+# Listings whose results can change when a favorite flag or tags change;
+# adds and deletes reach every listing.
+FAVORITE_LISTINGS = ("all", "page", "search")
+TAG_LISTINGS = ("all", "page", "search", "tag_counts")
+
+
+class LRUCache:
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return _MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SnippetCache:
+    """Snippet rows, projections of them and listing results.
+
+    Listing keys carry the generation of their kind. Invalidating bumps the
+    generations of the affected kinds only, so other listings stay cached
+    and stale entries simply age out of the LRU.
+    """
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL):
+        self.snippets = LRUCache(max_size, ttl)
+        # snippet id -> {columns: projected row}
+        self.projections = LRUCache(max_size, ttl)
+        self.listings = LRUCache(max_size, ttl)
+        self.generations = dict.fromkeys(LISTINGS, 0)
+        self.lock = Lock()
+
+    def listing_key(self, kind, *args):
+        return (kind, self.generations[kind], *args)
+
+    def invalidate(self, *snippet_ids, listings=LISTINGS):
+        for snippet_id in snippet_ids:
+            self.snippets.pop(snippet_id)
+            self.projections.pop(snippet_id)
+        with self.lock:
+            for kind in listings:
+                self.generations[kind] += 1
+
+    def stats(self):
+        return {
+            "snippets": self.snippets.stats(),
+            "projections": self.projections.stats(),
+            "listings": self.listings.stats(),
+        }
+
+
+shared_cache = SnippetCache()
+
+
+def with_cache(repository, deferred=False):
+    if CACHE_ENABLED:
+        return CachedRepository(repository, shared_cache, deferred=deferred)
+    return repository
+
+
+class CachedRepository(SnippetRepository):
+    """Read-through cache in front of a repository.
+
+    With ``deferred`` the invalidations from writes are held back until
+    ``flush_invalidations()``, for callers that commit later; invalidating
+    before the commit would let a concurrent read re-cache the old row.
+    """
+
+    def __init__(self, repository, cache, deferred=False):
+        self.repository = repository
+        self.cache = cache
+        self.deferred = [] if deferred else None
+
+    def _invalidate(self, *snippet_ids, listings=LISTINGS):
+        if self.deferred is None:
+            self.cache.invalidate(*snippet_ids, listings=listings)
+        else:
+            self.deferred.append((snippet_ids, listings))
+
+    def flush_invalidations(self):
+        for snippet_ids, listings in self.deferred or ():
+            self.cache.invalidate(*snippet_ids, listings=listings)
+        if self.deferred:
+            self.deferred.clear()
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def _listing(self, kind, key, load):
+        # The generation is read before loading, so a result computed while
+        # a write lands is stored under the old generation and never served.
+        key = self.cache.listing_key(kind, *key)
+        result = self.cache.listings.get(key)
+        if result is _MISSING:
+            result = load()
+            self.cache.listings.set(key, result)
+        return result
+
+    def add(self, snippet, on_duplicate="allow"):
+        result = self.repository.add(snippet, on_duplicate)
+        self._invalidate(snippet.id)
+        return result
+
+    def add_many(self, snippets):
+        results = self.repository.add_many(snippets)
+        self._invalidate(*(snippet.id for snippet in snippets))
+        return results
+
+    def all(self):
+        return self._listing("all", (), self.repository.all)
+
+    def page(
+        self,
+        limit,
+        cursor=None,
+        tags=None,
+        match="all",
+        columns=None,
+        language=None,
+        favorite=None,
+        created_after=None,
+        updated_after=None,
+        sort="id",
+    ):
+        key = (
+            limit,
+            cursor,
+            tuple(tags or ()),
+            match,
+            columns and tuple(columns),
+            language,
+            favorite,
+            created_after,
+            updated_after,
+            sort,
+        )
+        return self._listing(
+            "page",
+            key,
+            lambda: self.repository.page(
+                limit,
+                cursor=cursor,
+                tags=tags,
+                match=match,
+                columns=columns,
+                language=language,
+                favorite=favorite,
+                created_after=created_after,
+                updated_after=updated_after,
+                sort=sort,
+            ),
+        )
+
+    def stream(self, batch_size=1000):
+        return self.repository.stream(batch_size=batch_size)
+
+    def _cached(self, snippet_id, columns):
+        result = self.cache.snippets.get(snippet_id)
+        if result is not _MISSING:
+            return project(result, columns)
+        if columns is None:
+            return _MISSING
+        projections = self.cache.projections.get(snippet_id)
+        if projections is _MISSING:
+            return _MISSING
+        return projections.get(tuple(columns), _MISSING)
+
+    def _store(self, snippet_id, columns, result):
+        if columns is None:
+            self.cache.snippets.set(snippet_id, result)
+            return
+        projections = self.cache.projections.get(snippet_id)
+        if projections is _MISSING:
+            projections = {}
+            self.cache.projections.set(snippet_id, projections)
+        projections[tuple(columns)] = result
+
+    def get(self, snippet_id, columns=None):
+        # A projection is fetched and cached on its own rather than loading
+        # the whole row to cut it down.
+        result = self._cached(snippet_id, columns)
+        if result is _MISSING:
+            result = self.repository.get(snippet_id, columns=columns)
+            if result is not None:
+                self._store(snippet_id, columns, result)
+        return result
+
+    def get_many(self, snippet_ids, columns=None):
+        snippet_ids = list(dict.fromkeys(snippet_ids))
+        cached = {}
+        for snippet_id in snippet_ids:
+            result = self._cached(snippet_id, columns)
+            if result is not _MISSING:
+                cached[snippet_id] = result
+        uncached = [id for id in snippet_ids if id not in cached]
+        missing = []
+        if uncached:
+            items, missing = self.repository.get_many(uncached, columns=columns)
+            for item in items:
+                self._store(item["id"], columns, item)
+                cached[item["id"]] = item
+        items = [cached[id] for id in snippet_ids if id in cached]
+        return items, missing
+
+    def get_version(self, snippet_id):
+        # Always read through: conditional requests need the current version.
+        return self.repository.get_version(snippet_id)
+
+    def search(self, query, limit, offset=0):
+        return self._listing(
+            "search",
+            (query, limit, offset),
+            lambda: self.repository.search(query, limit, offset=offset),
+        )
+
+    def tag_counts(self):
+        return self._listing("tag_counts", (), self.repository.tag_counts)
+
+    def duplicates(self, limit=100):
+        return self._listing(
+            "duplicates", (limit,), lambda: self.repository.duplicates(limit)
+        )
+
+    def similar(self, snippet_id, limit=10, threshold=DEFAULT_THRESHOLD):
+        return self._listing(
+            "similar",
+            (snippet_id, limit, threshold),
+            lambda: self.repository.similar(snippet_id, limit, threshold),
+        )
+
+    def delete(self, snippet_id, expected_version=None):
+        result = self.repository.delete(snippet_id, expected_version=expected_version)
+        self._invalidate(snippet_id)
+        return result
+
+    def toggle_favorite(self, snippet_id, expected_version=None):
+        result = self.repository.toggle_favorite(
+            snippet_id, expected_version=expected_version
+        )
+        self._invalidate(snippet_id, listings=FAVORITE_LISTINGS)
+        return result
+
+    def tag(self, snippet_id, *tags, remove=False):
+        return self.update_tags(snippet_id, *tags, remove=remove)["message"]
+
+    def update_tags(self, snippet_id, *tags, remove=False, expected_version=None):
+        result = self.repository.update_tags(
+            snippet_id, *tags, remove=remove, expected_version=expected_version
+        )
+        self._invalidate(snippet_id, listings=TAG_LISTINGS)
+        return result
+
+    def _existing_tag(self, snippet_id):
+        return self.repository._existing_tag(snippet_id)
+
+    def _save_tag(self, snippet_id, updated):
+        self.repository._save_tag(snippet_id, updated)
+        self._invalidate(snippet_id, listings=TAG_LISTINGS)
+
+    def _add_tag(self, snippet_id, *tags, existing_tags):
+        return self.repository._add_tag(snippet_id, *tags, existing_tags=existing_tags)
+
+    def _remove_tag(self, snippet_id, *tags, existing_tags):
+        return self.repository._remove_tag(
+            snippet_id, *tags, existing_tags=existing_tags
+        )
@@ -1,17 +1,57 @@
+import shlex
+import sys
+from datetime import datetime
+from pathlib import Path
+
 import typer
-from sqlmodel import Session
 
-from snipster.models import DATABASE_URL, Language, Snippet, create_engine
-from snipster.repo import DatastoreRepository
+from snipster.constants import DEFAULT_THRESHOLD, Language
+from snipster.exceptions import (
+    DuplicateSnippet,
+    InvalidCursor,
+    NoTagsPresent,
+    SnippetExists,
+    SnippetNotFound,
+    TagExists,
+    TagNotFound,
+)
+
+# sqlmodel, SQLAlchemy and pydantic are imported inside the functions that
+# need them, so --help and argument errors skip that import cost.
+
+DEFAULT_PAGE_SIZE = 100
+LANGUAGES = [language.value for language in Language]
+SORT_ORDERS = [
+    "id",
+    "-id",
+    "created_at",
+    "-created_at",
+    "updated_at",
+    "-updated_at",
+]
+REPOSITORY_ERRORS = (
+    DuplicateSnippet,
+    SnippetExists,
+    SnippetNotFound,
+    TagExists,
+    TagNotFound,
+    NoTagsPresent,
+)
 
 app = typer.Typer()
 
 
-@app.callback()
-def init(ctx: typer.Context):
-    if ctx.obj is None:
-        engine = create_engine(DATABASE_URL)
-        ctx.obj = DatastoreRepository(Session(engine))
+def _repository(ctx):
+    root = ctx.find_root()
+    if root.obj is None:
+        from sqlmodel import Session
+
+        from snipster.cache import with_cache
+        from snipster.models import get_engine
+        from snipster.repo import DatastoreRepository
+
+        root.obj = with_cache(DatastoreRepository(Session(get_engine())))
+    return root.obj
 
 
 @app.command()
@@ -27,12 +67,24 @@ def add(
         None, help="Short, descriptive label used to group snippets"
     ),
     favorite: bool = typer.Option(False, help="Mark this snippet as a favorite"),
+    on_duplicate: str = typer.Option(
+        None,
+        help="When another snippet has the same code: allow, reject or link "
+        "(default: DUPLICATE_POLICY)",
+    ),
 ):
-    languages = [language.value for language in Language]
-    if language.lower() not in languages:
-        raise typer.BadParameter(f"Language must be {', '.join(languages)}")
-    language = Language(language)
-    repo: DatastoreRepository = ctx.obj
+    if language.lower() not in LANGUAGES:
+        raise typer.BadParameter(f"Language must be {', '.join(LANGUAGES)}")
+    from snipster.dedup import DUPLICATE_POLICIES, DUPLICATE_POLICY
+
+    if on_duplicate is not None and on_duplicate not in DUPLICATE_POLICIES:
+        raise typer.BadParameter(
+            f"On duplicate must be {', '.join(DUPLICATE_POLICIES)}"
+        )
+    from snipster.models import Snippet
+
+    language = Language(language.lower())
+    repo = _repository(ctx)
     snippet = Snippet(
         title=title,
         code=code,
@@ -41,20 +93,101 @@ def add(
         tags=tags,
         favorite=favorite,
     )
-    snippet = repo.add(snippet)
+    snippet = repo.add(snippet, on_duplicate or DUPLICATE_POLICY)
     print(snippet)
 
 
 @app.command()
-def all(ctx: typer.Context):
-    repo: DatastoreRepository = ctx.obj
-    snippets = repo.all()
+def all(
+    ctx: typer.Context,
+    limit: int = typer.Option(None, help="Maximum number of snippets to return"),
+    cursor: str = typer.Option(None, help="Cursor printed by the previous page"),
+    tag: list[str] = typer.Option(None, help="Only list snippets with this tag"),
+    any_tag: bool = typer.Option(
+        False, help="Match snippets with any of the tags instead of all of them"
+    ),
+    language: str = typer.Option(None, help="Only list snippets in this language"),
+    favorite: bool = typer.Option(
+        None, help="Only list favorites, or with --no-favorite only non-favorites"
+    ),
+    created_after: datetime = typer.Option(
+        None, help="Only list snippets created after this time (UTC if no offset)"
+    ),
+    updated_after: datetime = typer.Option(
+        None, help="Only list snippets updated after this time (UTC if no offset)"
+    ),
+    sort: str = typer.Option("id", help=f"Listing order: {', '.join(SORT_ORDERS)}"),
+):
+    if language is not None and language.lower() not in LANGUAGES:
+        raise typer.BadParameter(f"Language must be {', '.join(LANGUAGES)}")
+    if sort not in SORT_ORDERS:
+        raise typer.BadParameter(f"Sort must be {', '.join(SORT_ORDERS)}")
+    repo = _repository(ctx)
+    filters = {
+        "language": language and language.lower(),
+        "favorite": favorite,
+        "created_after": created_after,
+        "updated_after": updated_after,
+    }
+    if (
+        limit is None
+        and cursor is None
+        and not tag
+        and sort == "id"
+        and not any(value is not None for value in filters.values())
+    ):
+        snippets = repo.all()
+        print(snippets)
+        return
+    try:
+        snippets, next_cursor = repo.page(
+            limit or DEFAULT_PAGE_SIZE,
+            cursor=cursor,
+            tags=tag,
+            match="any" if any_tag else "all",
+            sort=sort,
+            **filters,
+        )
+    except InvalidCursor as error:
+        raise typer.BadParameter(error.message)
+    print(snippets)
+    if next_cursor is not None:
+        print(f"Next cursor: {next_cursor}")
+
+
+@app.command()
+def search(
+    ctx: typer.Context,
+    query: str = typer.Option(
+        ..., help="Words to look for in title, description and code"
+    ),
+    limit: int = typer.Option(20, help="Maximum number of snippets to return"),
+    offset: int = typer.Option(0, help="Number of ranked results to skip"),
+):
+    repo = _repository(ctx)
+    snippets = repo.search(query, limit, offset=offset)
     print(snippets)
 
 
+@app.command()
+def similar(
+    ctx: typer.Context,
+    id: int = typer.Option(..., help="Snippet ID to compare against"),
+    limit: int = typer.Option(10, help="Maximum number of snippets to return"),
+    threshold: float = typer.Option(
+        DEFAULT_THRESHOLD,
+        min=0,
+        max=1,
+        help="Minimum estimated similarity, from 0 to 1",
+    ),
+):
+    repo = _repository(ctx)
+    print(repo.similar(id, limit, threshold))
+
+
 @app.command()
 def get(ctx: typer.Context, id: int = typer.Option(..., help="Snippet ID to fetch")):
-    repo: DatastoreRepository = ctx.obj
+    repo = _repository(ctx)
     snippet = repo.get(id)
     print(snippet)
 
@@ -63,7 +196,7 @@ def get(ctx: typer.Context, id: int = typer.Option(..., help="Snippet ID to fetc
 def delete(
     ctx: typer.Context, id: int = typer.Option(..., help="Snippet ID to delete")
 ):
-    repo: DatastoreRepository = ctx.obj
+    repo = _repository(ctx)
     snippet = repo.delete(id)
     print(snippet)
 
@@ -73,7 +206,7 @@ def favorite(
     ctx: typer.Context,
     id: int = typer.Option(..., help="Snippet ID to mark or unmark as favorite"),
 ):
-    repo: DatastoreRepository = ctx.obj
+    repo = _repository(ctx)
     snippet = repo.toggle_favorite(id)
     print(snippet)
 
@@ -87,6 +220,137 @@ def tag(
         False, help="Set to true if you would like to remove the tag"
     ),
 ):
-    repo: DatastoreRepository = ctx.obj
-    snippet = repo.tag(id, tags, remove=remove)
-    print(snippet)
+    repo = _repository(ctx)
+    result = repo.update_tags(id, tags, remove=remove)
+    print(result["message"])
+
+
+@app.command()
+def export(
+    ctx: typer.Context,
+    output: Path = typer.Option(None, help="NDJSON file to write, defaults to stdout"),
+):
+    from snipster.transfer import to_ndjson
+
+    repo = _repository(ctx)
+    chunks = to_ndjson(repo.stream())
+    if output is None:
+        sys.stdout.writelines(chunks)
+        return
+    with open(output, "w") as file:
+        file.writelines(chunks)
+
+
+@app.command("import")
+def import_(
+    ctx: typer.Context,
+    input: Path = typer.Option(
+        None, help="NDJSON or JSON array file to read, defaults to stdin"
+    ),
+):
+    from snipster.transfer import import_snippets, read_records
+
+    repo = _repository(ctx)
+    if input is None:
+        report = import_snippets(repo, read_records(sys.stdin))
+    else:
+        with open(input) as file:
+            report = import_snippets(repo, read_records(file))
+    print(f"Imported {len(report['created'])} snippets")
+    for error in report["errors"]:
+        print(f"Record {error['index']}: {error['error']}")
+
+
+@app.command()
+def tags(ctx: typer.Context):
+    repo = _repository(ctx)
+    print(repo.tag_counts())
+
+
+@app.command()
+def duplicates(
+    ctx: typer.Context,
+    limit: int = typer.Option(20, help="Maximum number of duplicate groups"),
+):
+    repo = _repository(ctx)
+    print(repo.duplicates(limit))
+
+
+@app.command()
+def migrate_tags(ctx: typer.Context):
+    repo = _repository(ctx)
+    count = repo.migrate_tags()
+    print(f"Linked tags for {count} snippets")
+
+
+@app.command()
+def migrate_code_hashes(ctx: typer.Context):
+    repo = _repository(ctx)
+    count = repo.migrate_code_hashes()
+    print(f"Hashed code for {count} snippets")
+
+
+@app.command()
+def migrate_similarity(ctx: typer.Context):
+    repo = _repository(ctx)
+    count = repo.migrate_similarity()
+    print(f"Indexed similarity for {count} snippets")
+
+
+def _run_line(command, line, repo):
+    """Run one CLI command line against ``repo``; return whether it succeeded."""
+    try:
+        args = shlex.split(line, comments=True)
+    except ValueError as error:
+        print(f"Cannot parse line: {error}")
+        return False
+    if not args:
+        return True
+    if args[0] in ("shell", "batch"):
+        print(f"{args[0]} cannot be nested")
+        return False
+    try:
+        # Standalone mode prints usage errors itself and always exits.
+        command.main(args, obj=repo, prog_name="snipster")
+    except SystemExit as exit:
+        return not exit.code
+    except REPOSITORY_ERRORS as error:
+        print(error.message)
+        return False
+    return True
+
+
+@app.command()
+def shell(ctx: typer.Context):
+    """Read commands interactively and run them over one database session."""
+    command = typer.main.get_command(app)
+    repo = _repository(ctx)
+    while True:
+        try:
+            line = input("snipster> ")
+        except EOFError:
+            break
+        if line.strip() in ("exit", "quit"):
+            break
+        _run_line(command, line, repo)
+
+
+@app.command()
+def batch(
+    ctx: typer.Context,
+    stop_on_error: bool = typer.Option(
+        False, help="Stop at the first command that fails"
+    ),
+):
+    """Run one command per stdin line over one database session."""
+    command = typer.main.get_command(app)
+    repo = _repository(ctx)
+    failures = 0
+    for line in sys.stdin:
+        if _run_line(command, line, repo):
+            continue
+        failures += 1
+        if stop_on_error:
+            break
+    if failures:
+        raise typer.Exit(code=1)
@@ -0,0 +1,58 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def _utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def snippet_etag(snippet_id, updated_at, columns=None):
+    version = int(_utc(updated_at).timestamp() * 1_000_000)
+    tag = f"{snippet_id}-{version}"
+    if columns is not None:
+        # Projections are distinct representations, so tag them separately.
+        digest = hashlib.blake2b(",".join(columns).encode(), digest_size=4)
+        tag = f"{tag}-{digest.hexdigest()}"
+    return f'"{tag}"'
+
+
+def body_etag(body):
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def http_date(value):
+    return format_datetime(_utc(value).replace(microsecond=0), usegmt=True)
+
+
+def etag_matches(header, etag, weak=True):
+    """Match an If-Match / If-None-Match header against ``etag``.
+
+    If-None-Match uses weak comparison; If-Match passes ``weak=False`` so a
+    ``W/`` tag never matches.
+    """
+    tags = [tag.strip() for tag in header.split(",")]
+    if weak:
+        tags = [tag.removeprefix("W/") for tag in tags]
+    return "*" in tags or etag in tags
+
+
+def not_modified(headers, etag, last_modified=None):
+    """Whether a GET can be answered with 304 Not Modified.
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted when
+    the client sent no entity tags.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return _utc(last_modified).replace(microsecond=0) <= _utc(since)
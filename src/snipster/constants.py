@@ -0,0 +1,19 @@
+"""Values shared by the models and the CLI.
+
+Only the standard library is imported here, so the CLI can build its options
+from these without loading sqlmodel.
+"""
+
+from enum import Enum
+
+DEFAULT_THRESHOLD = 0.5
+
+
+class Language(Enum):
+    PYTHON = "python"
+    JAVASCRIPT = "javascript"
+    RUST = "rust"
+    GO = "go"
+    TYPESCRIPT = "typescript"
+    SQL = "sql"
+    PLSQL = "plsql"
@@ -0,0 +1,21 @@
+import hashlib
+
+from decouple import Choices, config
+
+DUPLICATE_POLICIES = ["allow", "reject", "link"]
+DUPLICATE_POLICY = config(
+    "DUPLICATE_POLICY", default="allow", cast=Choices(DUPLICATE_POLICIES)
+)
+
+
+def normalize_code(code):
+    """Canonical form of ``code`` for hashing.
+
+    Line endings, trailing whitespace and blank lines at either end are
+    ignored, so a re-pasted copy hashes the same as the original.
+    """
+    return "\n".join(line.rstrip() for line in code.splitlines()).strip("\n")
+
+
+def code_hash(code):
+    return hashlib.blake2b(normalize_code(code).encode(), digest_size=16).hexdigest()
@@ -26,3 +26,22 @@ class NoTagsPresent(BaseException):
     def __init__(self, snippet_id):
         self.message = "Please add a tag before trying to remove tags"
         super().__init__(self.message)
+
+
+class InvalidCursor(BaseException):
+    def __init__(self, cursor):
+        self.message = f"Cursor {cursor} is not valid"
+        super().__init__(self.message)
+
+
+class DuplicateSnippet(BaseException):
+    def __init__(self, snippet_id):
+        self.snippet_id = snippet_id
+        self.message = f"Snippet ID: {snippet_id} already has this code"
+        super().__init__(self.message)
+
+
+class VersionConflict(BaseException):
+    def __init__(self, snippet_id):
+        self.message = f"Snippet ID: {snippet_id} was modified by another request"
+        super().__init__(self.message)
@@ -0,0 +1,167 @@
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from snipster.serialization import dumps
+
+SLOW_REQUEST_SECONDS = config("SLOW_REQUEST_SECONDS", default=1.0, cast=float)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger("snipster.slow_requests")
+
+_request = ContextVar("snipster_request_stats", default=None)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            counts = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: list(counts) for labels, counts in self.series.items()}
+        for labels, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket = _format_labels((*self.labels, "le"), (*labels, bound))
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            suffix = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{suffix} {counts[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauges(self, name, help, collect):
+        """Register gauges read from ``collect()`` (a dict) at render time."""
+        self.collectors.append((name, help, collect))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, help, collect in self.collectors:
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge"])
+            for key, value in collect().items():
+                lines.append(f'{name}{{key="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+request_seconds = registry.histogram(
+    "snipster_http_request_duration_seconds",
+    "HTTP request latency by route",
+    labels=("method", "route", "status"),
+)
+request_queries = registry.histogram(
+    "snipster_http_request_queries",
+    "SQL statements executed per HTTP request",
+    labels=("method", "route"),
+    buckets=COUNT_BUCKETS,
+)
+query_seconds = registry.histogram(
+    "snipster_db_query_duration_seconds", "SQL statement latency"
+)
+repository_seconds = registry.histogram(
+    "snipster_repository_duration_seconds",
+    "Repository method latency",
+    labels=("method",),
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _request.set(stats)
+
+
+def finish_request(token, stats, method, route, status, elapsed):
+    _request.reset(token)
+    request_seconds.observe(elapsed, method, route, str(status))
+    request_queries.observe(stats.queries, method, route)
+    if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+        record = {
+            "method": method,
+            "route": route,
+            "status": status,
+            "seconds": round(elapsed, 4),
+            "queries": stats.queries,
+            "query_seconds": round(stats.query_seconds, 4),
+        }
+        logger.warning(dumps(record).decode())
+
+
+@contextmanager
+def timed(method):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        repository_seconds.observe(time.perf_counter() - started, method)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("snipster_query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["snipster_query_started"].pop()
+    query_seconds.observe(elapsed)
+    stats = _request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get("snipster_query_started")
+        if started:
+            started.pop()
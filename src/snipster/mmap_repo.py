@@ -0,0 +1,550 @@
+import heapq
+import mmap
+import os
+import struct
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from itertools import islice
+
+from snipster.dedup import code_hash
+from snipster.exceptions import SnippetExists, SnippetNotFound
+from snipster.repo import (
+    SnippetRepository,
+    after_position,
+    cursor_position,
+    matches_filters,
+    page_cursor,
+    parse_sort,
+    parse_tags,
+    project,
+    resolve_duplicate,
+    sort_key,
+)
+from snipster.search import tokenize
+from snipster.serialization import dumps, loads
+from snipster.similarity import (
+    DEFAULT_THRESHOLD,
+    MAX_CANDIDATES,
+    SIGNATURE,
+    band_keys,
+    pack_signature,
+    rank,
+    signature,
+    unpack_signature,
+)
+
+# id, offset into the data file, record length (0 marks a deletion)
+ENTRY = struct.Struct("<qQI")
+# LSH band, bucket, snippet id, offset of its signature in the .sig file
+BAND = struct.Struct("<qqqQ")
+
+
+def _code_hash(snippet):
+    # Records written before code hashes existed are hashed on the fly.
+    return snippet.get("code_hash") or code_hash(snippet["code"])
+
+
+def _read_log(path, entry):
+    """Unpack the entries in ``path``, dropping a torn one at the end."""
+    with open(path, "ab+") as log:
+        log.seek(0)
+        raw = log.read()
+        usable = len(raw) - len(raw) % entry.size
+        if usable != len(raw):
+            log.truncate(usable)
+    return entry.iter_unpack(raw[:usable])
+
+
+def _remap(path, mapped, end):
+    """Return a read-only map of ``path`` that covers byte ``end``."""
+    if mapped is None or end > len(mapped):
+        if mapped is not None:
+            mapped.close()
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped
+
+
+def _has_tags(existing, tags, match):
+    if match == "any":
+        return not set(existing).isdisjoint(tags)
+    return set(existing).issuperset(tags)
+
+
+class MmapRepository(SnippetRepository):
+    """Snippet store backed by a memory-mapped data file and an id index.
+
+    ``<path>.data`` holds one JSON record per line and is only ever appended
+    to. ``<path>.idx`` is a sorted array of fixed-width index entries that is
+    binary searched through a memory map, and ``<path>.log`` holds the index
+    entries written since the last merge. Opening the store only reads the
+    log, so startup time and memory do not grow with the corpus.
+
+    ``similar`` works the same way: ``<path>.sig`` appends each snippet's
+    packed MinHash signature, ``<path>.bands`` is a sorted array of LSH
+    bucket entries pointing at them, and ``<path>.bandlog`` holds the
+    entries added since the last merge.
+
+    Lookups by id and similar code use these indexes. Listings, search, tag
+    counts, duplicates and ``on_duplicate`` checks scan the whole data file,
+    and ``duplicates`` holds one hash per record while it does.
+    """
+
+    def __init__(self, path, merge_every=10000):
+        self.data_path = f"{path}.data"
+        self.index_path = f"{path}.idx"
+        self.log_path = f"{path}.log"
+        self.signature_path = f"{path}.sig"
+        self.bands_path = f"{path}.bands"
+        self.band_log_path = f"{path}.bandlog"
+        self.merge_every = merge_every
+        self.delta = {}
+        self.band_delta = defaultdict(list)
+        self.data_map = None
+        self.index_map = None
+        self.signature_map = None
+        self.bands_map = None
+        self.count = 0
+        self.band_count = 0
+
+    def __enter__(self):
+        self.data_file = open(self.data_path, "ab")
+        self._map_index()
+        self.delta = {}
+        for id, offset, length in _read_log(self.log_path, ENTRY):
+            self.delta[id] = (offset, length)
+        self.log_file = open(self.log_path, "ab")
+        self.signature_file = open(self.signature_path, "ab")
+        self._map_bands()
+        self.band_delta = defaultdict(list)
+        for band, bucket, id, offset in _read_log(self.band_log_path, BAND):
+            self.band_delta[band, bucket].append((id, offset))
+        self.band_log_file = open(self.band_log_path, "ab")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for file in (
+            self.data_file,
+            self.log_file,
+            self.signature_file,
+            self.band_log_file,
+        ):
+            file.close()
+        for mapped in (
+            self.data_map,
+            self.index_map,
+            self.signature_map,
+            self.bands_map,
+        ):
+            if mapped is not None:
+                mapped.close()
+        self.data_map = self.index_map = None
+        self.signature_map = self.bands_map = None
+
+    def _map_index(self):
+        if self.index_map is not None:
+            self.index_map.close()
+            self.index_map = None
+        self.count = 0
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path):
+            with open(self.index_path, "rb") as file:
+                self.index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.count = len(self.index_map) // ENTRY.size
+
+    def _map_bands(self):
+        if self.bands_map is not None:
+            self.bands_map.close()
+            self.bands_map = None
+        self.band_count = 0
+        if os.path.exists(self.bands_path) and os.path.getsize(self.bands_path):
+            with open(self.bands_path, "rb") as file:
+                self.bands_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.band_count = len(self.bands_map) // BAND.size
+
+    def _entry(self, position):
+        return ENTRY.unpack_from(self.index_map, position * ENTRY.size)
+
+    def _bisect(self, snippet_id):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < snippet_id:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _locate(self, snippet_id):
+        if snippet_id in self.delta:
+            offset, length = self.delta[snippet_id]
+            return (offset, length) if length else None
+        position = self._bisect(snippet_id)
+        if position < self.count:
+            id, offset, length = self._entry(position)
+            if id == snippet_id:
+                return offset, length
+        return None
+
+    def _entries(self, after=None):
+        start = 0 if after is None else self._bisect(after + 1)
+        base = (
+            (id, 1, offset, length)
+            for id, offset, length in map(self._entry, range(start, self.count))
+        )
+        delta = sorted(
+            (id, 0, offset, length)
+            for id, (offset, length) in self.delta.items()
+            if after is None or id > after
+        )
+        previous = None
+        for id, _, offset, length in heapq.merge(base, delta):
+            if id == previous:
+                continue
+            previous = id
+            if length:
+                yield id, offset, length
+
+    def _read(self, offset, length):
+        self.data_map = _remap(self.data_path, self.data_map, offset + length)
+        return loads(self.data_map[offset : offset + length])
+
+    def _band_entry(self, position):
+        return BAND.unpack_from(self.bands_map, position * BAND.size)
+
+    def _band_matches(self, key):
+        low, high = 0, self.band_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._band_entry(middle)[:2] < key:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.band_count:
+            band, bucket, id, offset = self._band_entry(low)
+            if (band, bucket) != key:
+                break
+            yield id, offset
+            low += 1
+        yield from self.band_delta.get(key, ())
+
+    def _signature(self, offset):
+        end = offset + SIGNATURE.size
+        self.signature_map = _remap(self.signature_path, self.signature_map, end)
+        return unpack_signature(self.signature_map[offset:end])
+
+    def _index_similarity(self, snippet_id, code):
+        minhash = signature(code)
+        if minhash is None:
+            return
+        offset = self.signature_file.tell()
+        self.signature_file.write(pack_signature(minhash))
+        self.signature_file.flush()
+        keys = list(band_keys(minhash))
+        self.band_log_file.write(
+            b"".join(BAND.pack(*key, snippet_id, offset) for key in keys)
+        )
+        self.band_log_file.flush()
+        for key in keys:
+            self.band_delta[key].append((snippet_id, offset))
+
+    def _records(self, after=None):
+        for id, offset, length in self._entries(after):
+            yield self._read(offset, length)
+
+    def _log(self, snippet_id, offset, length):
+        self.log_file.write(ENTRY.pack(snippet_id, offset, length))
+        self.log_file.flush()
+        self.delta[snippet_id] = (offset, length)
+        if len(self.delta) >= self.merge_every:
+            self.merge()
+
+    def _write(self, snippet):
+        record = dumps(snippet)
+        offset = self.data_file.tell()
+        self.data_file.write(record + b"\n")
+        self.data_file.flush()
+        self._log(snippet["id"], offset, len(record))
+
+    def _max_id(self):
+        ids = list(self.delta)
+        if self.count:
+            ids.append(self._entry(self.count - 1)[0])
+        return max(ids, default=0)
+
+    def merge(self):
+        temporary = f"{self.index_path}.tmp"
+        with open(temporary, "wb") as file:
+            for entry in self._entries():
+                file.write(ENTRY.pack(*entry))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.index_path)
+        self._map_index()
+        self.log_file.truncate(0)
+        self.delta = {}
+        self._merge_bands()
+
+    def _merge_bands(self):
+        # Entries of deleted snippets are dropped here.
+        temporary = f"{self.bands_path}.tmp"
+        base = map(self._band_entry, range(self.band_count))
+        delta = sorted(
+            (*key, id, offset)
+            for key, entries in self.band_delta.items()
+            for id, offset in entries
+        )
+        with open(temporary, "wb") as file:
+            for entry in heapq.merge(base, delta):
+                if self._locate(entry[2]) is not None:
+                    file.write(BAND.pack(*entry))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.bands_path)
+        self._map_bands()
+        self.band_log_file.truncate(0)
+        self.band_delta = defaultdict(list)
+
+    def migrate_similarity(self):
+        """Rebuild the similarity files from the data file; return the count."""
+        if self.signature_map is not None:
+            self.signature_map.close()
+            self.signature_map = None
+        self.signature_file.truncate(0)
+        self.band_log_file.truncate(0)
+        self.band_delta = defaultdict(list)
+        if os.path.exists(self.bands_path):
+            os.remove(self.bands_path)
+        self._map_bands()
+        count = 0
+        for snippet in self._records():
+            self._index_similarity(snippet["id"], snippet["code"])
+            count += 1
+            if count % self.merge_every == 0:
+                self._merge_bands()
+        self._merge_bands()
+        return count
+
+    def add(self, snippet, on_duplicate="allow"):
+        snippet.code_hash = code_hash(snippet.code)
+        if on_duplicate != "allow":
+            existing = next(
+                (
+                    record["id"]
+                    for record in self._records()
+                    if _code_hash(record) == snippet.code_hash
+                ),
+                None,
+            )
+            linked = resolve_duplicate(snippet, existing, on_duplicate)
+            if linked is not None:
+                return linked
+        if snippet.id is None:
+            snippet.id = self._max_id() + 1
+        if self._locate(snippet.id) is not None:
+            raise SnippetExists(snippet.id)
+        # Bands first, so a merge triggered by the write includes them.
+        self._index_similarity(snippet.id, snippet.code)
+        self._write(snippet.model_dump())
+        return (
+            f"Snippet ID: {snippet.id} was created and added to the Snippet Repository"
+        )
+
+    def add_many(self, snippets):
+        results = []
+        for snippet in snippets:
+            try:
+                self.add(snippet)
+                results.append({"id": snippet.id})
+            except SnippetExists as error:
+                results.append({"error": error.message})
+        return results
+
+    def all(self):
+        return list(self._records())
+
+    def page(
+        self,
+        limit,
+        cursor=None,
+        tags=None,
+        match="all",
+        columns=None,
+        language=None,
+        favorite=None,
+        created_after=None,
+        updated_after=None,
+        sort="id",
+    ):
+        field, descending = parse_sort(sort)
+        position = cursor_position(cursor, sort)
+        ascending_ids = field == "id" and not descending
+        snippets = self._records(position[1] if position and ascending_ids else None)
+        snippets = (
+            snippet
+            for snippet in snippets
+            if matches_filters(
+                snippet, language, favorite, created_after, updated_after
+            )
+        )
+        if tags:
+            snippets = (
+                snippet
+                for snippet in snippets
+                if _has_tags(parse_tags(snippet["tags"]), tags, match)
+            )
+        if ascending_ids:
+            # Records come off the index in id order, so stop after one extra.
+            items = list(islice(snippets, limit + 1))
+        else:
+            if position is not None:
+                snippets = (
+                    snippet
+                    for snippet in snippets
+                    if after_position(sort_key(snippet, field), position, descending)
+                )
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            items = pick(
+                limit + 1, snippets, key=lambda snippet: sort_key(snippet, field)
+            )
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = page_cursor(items[-1], sort)
+        return [project(item, columns) for item in items], next_cursor
+
+    def stream(self, batch_size=1000):
+        return self._records()
+
+    def get(self, snippet_id, columns=None):
+        location = self._locate(int(snippet_id))
+        if location is None:
+            return None
+        return project(self._read(*location), columns)
+
+    def get_many(self, snippet_ids, columns=None):
+        snippet_ids = list(dict.fromkeys(int(id) for id in snippet_ids))
+        found = {id: self.get(id, columns=columns) for id in snippet_ids}
+        items = [item for item in found.values() if item is not None]
+        missing = [id for id, item in found.items() if item is None]
+        return items, missing
+
+    def get_version(self, snippet_id):
+        snippet = self.get(snippet_id)
+        return snippet["updated_at"] if snippet is not None else None
+
+    def search(self, query, limit, offset=0):
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        scored = []
+        for snippet in self._records():
+            fields = (snippet["title"], snippet["description"], snippet["code"])
+            counts = Counter(
+                token for field in filter(None, fields) for token in tokenize(field)
+            )
+            if all(token in counts for token in tokens):
+                scored.append((sum(counts[token] for token in tokens), snippet))
+        ranked = heapq.nlargest(offset + limit, scored, key=lambda item: item[0])
+        return [snippet for _, snippet in ranked[offset:]]
+
+    def tag_counts(self):
+        counts = Counter(
+            tag for snippet in self._records() for tag in parse_tags(snippet["tags"])
+        )
+        return [
+            {"tag": tag, "count": count}
+            for tag, count in sorted(
+                counts.items(), key=lambda item: (-item[1], item[0])
+            )
+        ]
+
+    def duplicates(self, limit=100):
+        groups = defaultdict(list)
+        for snippet in self._records():
+            groups[_code_hash(snippet)].append(snippet["id"])
+        groups = heapq.nsmallest(
+            limit,
+            ((hash, ids) for hash, ids in groups.items() if len(ids) > 1),
+            key=lambda group: (-len(group[1]), group[0]),
+        )
+        return [
+            {"code_hash": hash, "count": len(ids), "ids": ids} for hash, ids in groups
+        ]
+
+    def similar(self, snippet_id, limit=10, threshold=DEFAULT_THRESHOLD):
+        snippet_id = int(snippet_id)
+        location = self._locate(snippet_id)
+        if location is None:
+            raise SnippetNotFound(snippet_id)
+        target = signature(self._read(*location)["code"])
+        if target is None:
+            return []
+        hits = Counter()
+        latest = {}
+        for key in band_keys(target):
+            for id, offset in self._band_matches(key):
+                if id != snippet_id:
+                    hits[id, offset] += 1
+                    latest[id] = max(latest.get(id, offset), offset)
+        # A re-added id keeps entries for its old signature until a merge.
+        candidates = [
+            candidate
+            for candidate in hits
+            if candidate[1] == latest[candidate[0]]
+            and self._locate(candidate[0]) is not None
+        ]
+        # Score only the snippets sharing the most buckets, like the datastore.
+        candidates = heapq.nsmallest(
+            MAX_CANDIDATES, candidates, key=lambda item: (-hits[item], item[0])
+        )
+        return rank(
+            target,
+            ((id, self._signature(offset)) for id, offset in candidates),
+            limit,
+            threshold,
+        )
+
+    def _update(self, snippet_id, **fields):
+        snippet = self.get(snippet_id)
+        if snippet is None:
+            raise SnippetNotFound(snippet_id)
+        snippet.update(fields, updated_at=datetime.now(timezone.utc))
+        self._write(snippet)
+        return snippet
+
+    def delete(self, snippet_id):
+        if self._locate(int(snippet_id)) is None:
+            raise SnippetNotFound(snippet_id)
+        self._log(int(snippet_id), 0, 0)
+        return f"Snippet ID: {snippet_id} was deleted and removed from the Snippet Repository"
+
+    def toggle_favorite(self, snippet_id):
+        snippet = self.get(snippet_id)
+        if snippet is None:
+            raise SnippetNotFound(snippet_id)
+        _favorite = snippet["favorite"]
+        self._update(snippet_id, favorite=not _favorite)
+        return f"Snippet ID: {snippet_id} favorite updated from {_favorite} to {not _favorite}"
+
+    def tag(self, snippet_id, *tags, remove=False):
+        base_result = super().tag(snippet_id, *tags, remove=remove)
+        return f"{base_result}"
+
+    def _existing_tag(self, snippet_id):
+        snippet = self.get(snippet_id)
+        if snippet is None:
+            raise SnippetNotFound(snippet_id)
+        return snippet["tags"].split(", ") if snippet["tags"] else []
+
+    def _save_tag(self, snippet_id, updated):
+        self._update(snippet_id, tags=", ".join(updated))
+
+    def _add_tag(self, snippet_id, *tags, existing_tags):
+        base_result = super()._add_tag(snippet_id, *tags, existing_tags=existing_tags)
+        return f"{base_result}"
+
+    def _remove_tag(self, snippet_id, *tags, existing_tags):
+        base_result = super()._remove_tag(
+            snippet_id, *tags, existing_tags=existing_tags
+        )
+        return f"{base_result}"
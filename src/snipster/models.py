@@ -1,39 +1,269 @@
 from datetime import datetime, timezone
-from enum import Enum
 
 from decouple import config
+from sqlalchemy import BigInteger, DateTime, Index, event, inspect, make_url, text
 from sqlalchemy import Enum as SQLAlchemyEnum
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Column, Field, Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from snipster.constants import Language
 
 DATABASE_URL = config("DATABASE_URL", cast=str)
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=int)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+_engine = None
+_async_engine = None
+
+
+def get_async_database_url():
+    url = config("ASYNC_DATABASE_URL", default=None)
+    if url is not None:
+        return url
+    url = make_url(DATABASE_URL)
+    backend = url.get_backend_name()
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def pool_options(url):
+    """Pool settings for ``url``, or none when its dialect does not queue.
+
+    In-memory SQLite gets a SingletonThreadPool or StaticPool, which reject
+    the sizing arguments.
+    """
+    url = make_url(url)
+    if not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+    return _engine
+
+
+def dispose_engine():
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        url = get_async_database_url()
+        _async_engine = create_async_engine(url, **pool_options(url))
+    return _async_engine
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+def _pool_stats(pool):
+    # SingletonThreadPool, StaticPool and NullPool keep no such counters.
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def pool_status():
+    """State of the async pool, which serves the API, and the sync one."""
+    status = _pool_stats(get_async_engine().pool)
+    for key, value in _pool_stats(get_engine().pool).items():
+        status[f"sync_{key}"] = value
+    return status
 
 
 def get_session():
-    engine = create_engine(DATABASE_URL)
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
 
 
-class Language(Enum):
-    PYTHON = "python"
-    JAVASCRIPT = "javascript"
-    RUST = "rust"
-    GO = "go"
-    TYPESCRIPT = "typescript"
-    SQL = "sql"
-    PLSQL = "plsql"
+async def get_async_session():
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
 
 
 class Snippet(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_snippet_language_id", "language", "id"),
+        Index("ix_snippet_created_at_id", "created_at", "id"),
+        Index("ix_snippet_updated_at_id", "updated_at", "id"),
+        Index(
+            "ix_snippet_favorite_id",
+            "id",
+            postgresql_where=text("favorite"),
+            sqlite_where=text("favorite"),
+        ),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     title: str
     code: str
     description: str | None
     language: Language = Field(sa_column=Column(SQLAlchemyEnum(Language)))
     tags: str | None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
     favorite: bool
+    code_hash: str | None = Field(default=None, index=True)
+
+
+class Tag(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
+class SnippetTag(SQLModel, table=True):
+    __table_args__ = (Index("ix_snippettag_tag_id_snippet_id", "tag_id", "snippet_id"),)
+
+    snippet_id: int = Field(
+        foreign_key="snippet.id", primary_key=True, ondelete="CASCADE"
+    )
+    tag_id: int = Field(foreign_key="tag.id", primary_key=True, ondelete="CASCADE")
+
+
+class SnippetBand(SQLModel, table=True):
+    """One LSH bucket of a snippet's MinHash signature (see similarity.py)."""
+
+    __table_args__ = (Index("ix_snippetband_snippet_id", "snippet_id"),)
+
+    band: int = Field(primary_key=True)
+    bucket: int = Field(sa_column=Column(BigInteger, primary_key=True))
+    snippet_id: int = Field(
+        foreign_key="snippet.id", primary_key=True, ondelete="CASCADE"
+    )
+
+
+class SnippetSignature(SQLModel, table=True):
+    """A snippet's packed MinHash signature, scored by similar()."""
+
+    snippet_id: int = Field(
+        foreign_key="snippet.id", primary_key=True, ondelete="CASCADE"
+    )
+    signature: bytes
+
+
+class SnippetChange(SQLModel, table=True):
+    seq: int | None = Field(default=None, primary_key=True)
+    snippet_id: int
+    op: str
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
+
+
+SEARCH_INDEX_DDL = {
+    "postgresql": [
+        "ALTER TABLE snippet ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(code, '')), 'C')) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_snippet_search_vector "
+        "ON snippet USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS snippet_fts USING fts5("
+        "title, description, code, content='snippet', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS snippet_fts_insert AFTER INSERT ON snippet "
+        "BEGIN INSERT INTO snippet_fts(rowid, title, description, code) "
+        "VALUES (new.id, new.title, new.description, new.code); END",
+        "CREATE TRIGGER IF NOT EXISTS snippet_fts_delete AFTER DELETE ON snippet "
+        "BEGIN INSERT INTO snippet_fts(snippet_fts, rowid, title, description, code) "
+        "VALUES ('delete', old.id, old.title, old.description, old.code); END",
+        "CREATE TRIGGER IF NOT EXISTS snippet_fts_update "
+        "AFTER UPDATE OF title, description, code ON snippet "
+        "BEGIN INSERT INTO snippet_fts(snippet_fts, rowid, title, description, code) "
+        "VALUES ('delete', old.id, old.title, old.description, old.code); "
+        "INSERT INTO snippet_fts(rowid, title, description, code) "
+        "VALUES (new.id, new.title, new.description, new.code); END",
+        "INSERT INTO snippet_fts(snippet_fts) VALUES ('rebuild')",
+    ],
+}
+
+
+def create_search_index(connection):
+    for statement in SEARCH_INDEX_DDL.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Snippet.__table__, "after_create")
+def _create_search_index(target, connection, **kw):
+    create_search_index(connection)
+
+
+def add_code_hash_column(connection):
+    """Add ``snippet.code_hash`` to a table created before it existed."""
+    columns = {column["name"] for column in inspect(connection).get_columns("snippet")}
+    if "code_hash" not in columns:
+        connection.exec_driver_sql("ALTER TABLE snippet ADD COLUMN code_hash VARCHAR")
+
+
+TIMESTAMP_COLUMNS = {
+    "snippet": ("created_at", "updated_at"),
+    "snippetchange": ("created_at",),
+}
+
+
+def convert_timestamp_columns(connection):
+    """Turn naive PostgreSQL timestamp columns into ``timestamptz``.
+
+    Older tables used ``TIMESTAMP WITHOUT TIME ZONE``, which asyncpg refuses
+    to bind aware datetimes to. Stored values are UTC, so they are converted
+    as such. SQLite keeps timestamps as text and needs no change.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    for table, names in TIMESTAMP_COLUMNS.items():
+        columns = {
+            column["name"]: column["type"]
+            for column in inspect(connection).get_columns(table)
+        }
+        for name in names:
+            if not getattr(columns.get(name), "timezone", True):
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {table} ALTER COLUMN {name} "
+                    f"TYPE TIMESTAMP WITH TIME ZONE USING {name} AT TIME ZONE 'UTC'"
+                )
+
+
+def create_snippet_indexes(connection):
+    """Add the snippet indexes to a table created before them."""
+    for index in Snippet.__table__.indexes:
+        index.create(connection, checkfirst=True)
 
 
 class SnippetBase(SQLModel):
@@ -49,12 +279,54 @@ class SnippetCreate(SnippetBase):
     pass
 
 
+class SnippetImport(SnippetBase):
+    id: int | None = None
+    description: str | None = None
+    language: Language
+    tags: str | None = None
+    favorite: bool = False
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
+class TagCount(SQLModel):
+    tag: str
+    count: int
+
+
 class SnippetPublic(SnippetBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    code_hash: str | None = None
+
+
+class DuplicateGroup(SQLModel):
+    code_hash: str
+    count: int
+    ids: list[int]
+
+
+class ChangeFeed(SQLModel):
+    changes: list[SnippetChange]
+    last_seq: int
+
+
+class SimilarSnippet(SQLModel):
+    id: int
+    similarity: float
+
+
+class SnippetBatch(SQLModel):
+    items: list[SnippetPublic]
+    missing: list[int]
 
 
 if __name__ == "__main__":
-    engine = create_engine(DATABASE_URL)
+    engine = get_engine()
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        add_code_hash_column(connection)
+        convert_timestamp_columns(connection)
+        create_snippet_indexes(connection)
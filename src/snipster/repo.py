@@ -1,23 +1,190 @@
+import asyncio
+import base64
+import binascii
+import heapq
 import json
+import os
+import sys
 from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from collections.abc import Mapping
 from datetime import datetime, timezone
 from enum import Enum
 
-from sqlmodel import select
+from sqlalchemy import (
+    column,
+    delete,
+    func,
+    literal,
+    literal_column,
+    table,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, insert, select
 
+from snipster.dedup import code_hash
 from snipster.exceptions import (
+    DuplicateSnippet,
+    InvalidCursor,
     NoTagsPresent,
     SnippetExists,
     SnippetNotFound,
     TagExists,
     TagNotFound,
+    VersionConflict,
+)
+from snipster.metrics import timed
+from snipster.models import (
+    Language,
+    Snippet,
+    SnippetBand,
+    SnippetChange,
+    SnippetSignature,
+    SnippetTag,
+    Tag,
 )
-from snipster.models import Snippet
+from snipster.search import InvertedIndex, tokenize
+from snipster.serialization import dumps, loads
+from snipster.similarity import (
+    DEFAULT_THRESHOLD,
+    MAX_CANDIDATES,
+    LSHIndex,
+    band_keys,
+    pack_signature,
+    rank,
+    signature,
+    unpack_signature,
+)
+
+
+def parse_tags(value):
+    tags = (tag.strip() for tag in value.split(",")) if value else ()
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+
+def project(snippet, columns):
+    if columns is None:
+        return snippet
+    return {column: snippet[column] for column in columns}
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, dict) or not isinstance(values.get("id"), int):
+        raise InvalidCursor(cursor)
+    return values
+
+
+SORT_FIELDS = ("id", "created_at", "updated_at")
+
+
+def parse_sort(sort):
+    """Split ``sort`` into its field and whether it is descending."""
+    field = sort.removeprefix("-")
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort by {sort}")
+    return field, sort.startswith("-")
+
+
+def as_utc(value):
+    """Coerce a datetime or ISO string to an aware UTC datetime.
+
+    Naive values are taken to be UTC already, which is how every backend
+    stores them.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def page_cursor(snippet, sort):
+    field, _ = parse_sort(sort)
+    if field == "id":
+        return encode_cursor({"id": snippet["id"]})
+    key = as_utc(snippet[field]).isoformat()
+    return encode_cursor({"id": snippet["id"], "sort": sort, "key": key})
+
+
+def cursor_position(cursor, sort):
+    """Return the (sort key, id) a cursor points at, or None without one."""
+    if cursor is None:
+        return None
+    values = decode_cursor(cursor)
+    field, _ = parse_sort(sort)
+    if field == "id":
+        if "sort" in values:
+            raise InvalidCursor(cursor)
+        return values["id"], values["id"]
+    if values.get("sort") != sort:
+        raise InvalidCursor(cursor)
+    try:
+        return as_utc(values["key"]), values["id"]
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+def matches_filters(snippet, language, favorite, created_after, updated_after):
+    if language is not None and _language_key(snippet["language"]) != _language_key(
+        language
+    ):
+        return False
+    if favorite is not None and snippet["favorite"] != favorite:
+        return False
+    if created_after is not None and as_utc(snippet["created_at"]) <= as_utc(
+        created_after
+    ):
+        return False
+    if updated_after is not None and as_utc(snippet["updated_at"]) <= as_utc(
+        updated_after
+    ):
+        return False
+    return True
+
+
+def sort_key(snippet, field):
+    if field == "id":
+        return snippet["id"], snippet["id"]
+    return as_utc(snippet[field]), snippet["id"]
+
+
+def after_position(key, position, descending):
+    return key < position if descending else key > position
+
+
+def resolve_duplicate(snippet, existing_id, on_duplicate):
+    """Apply ``on_duplicate`` when ``existing_id`` already has the same code.
+
+    Returns the message for a linked snippet, or None when it should be added.
+    """
+    if existing_id is None or on_duplicate == "allow":
+        return None
+    if on_duplicate == "reject":
+        raise DuplicateSnippet(existing_id)
+    snippet.id = existing_id
+    return f"Snippet ID: {existing_id} already has this code and was linked"
 
 
 class SnippetRepository(ABC):
     @abstractmethod
-    def add(self, snippet):
+    def add(self, snippet, on_duplicate="allow"):
+        pass
+
+    @abstractmethod
+    def add_many(self, snippets):
         pass
 
     @abstractmethod
@@ -25,7 +192,51 @@ class SnippetRepository(ABC):
         pass
 
     @abstractmethod
-    def get(self, snippet_id):
+    def page(
+        self,
+        limit,
+        cursor=None,
+        tags=None,
+        match="all",
+        columns=None,
+        language=None,
+        favorite=None,
+        created_after=None,
+        updated_after=None,
+        sort="id",
+    ):
+        pass
+
+    @abstractmethod
+    def stream(self, batch_size=1000):
+        pass
+
+    @abstractmethod
+    def get(self, snippet_id, columns=None):
+        pass
+
+    @abstractmethod
+    def get_many(self, snippet_ids, columns=None):
+        pass
+
+    @abstractmethod
+    def get_version(self, snippet_id):
+        pass
+
+    @abstractmethod
+    def search(self, query, limit, offset=0):
+        pass
+
+    @abstractmethod
+    def tag_counts(self):
+        pass
+
+    @abstractmethod
+    def duplicates(self, limit=100):
+        pass
+
+    @abstractmethod
+    def similar(self, snippet_id, limit=10, threshold=DEFAULT_THRESHOLD):
         pass
 
     @abstractmethod
@@ -43,6 +254,13 @@ class SnippetRepository(ABC):
             return self._remove_tag(snippet_id, *tags, existing_tags=existing_tags)
         return self._add_tag(snippet_id, *tags, existing_tags=existing_tags)
 
+    def update_tags(self, snippet_id, *tags, remove=False):
+        message = self.tag(snippet_id, *tags, remove=remove)
+        return {
+            "message": message,
+            "tags": parse_tags(", ".join(self._existing_tag(snippet_id))),
+        }
+
     @abstractmethod
     def _existing_tag(self, snippet_id):
         pass
@@ -53,56 +271,332 @@ class SnippetRepository(ABC):
 
     @abstractmethod
     def _add_tag(self, snippet_id, *tags, existing_tags):
-        conflict = [tag for tag in tags if tag in existing_tags]
+        # Arguments may hold comma-separated lists; compare tag by tag.
+        names = parse_tags(", ".join(tags))
+        existing_tags = parse_tags(", ".join(existing_tags))
+        conflict = [tag for tag in names if tag in existing_tags]
         if conflict:
             raise TagExists(snippet_id, conflict)
-        updated = existing_tags + list(tags)
+        updated = existing_tags + names
         self._save_tag(snippet_id, updated)
         return f"Tags {tags} were added for Snippet ID: {snippet_id}"
 
     @abstractmethod
     def _remove_tag(self, snippet_id, *tags, existing_tags):
+        names = parse_tags(", ".join(tags))
+        existing_tags = parse_tags(", ".join(existing_tags))
         if not existing_tags:
             raise NoTagsPresent(snippet_id)
 
-        missing = [tag for tag in tags if tag not in existing_tags]
+        missing = [tag for tag in names if tag not in existing_tags]
         if missing:
             raise TagNotFound(snippet_id, missing)
 
-        updated = [tag for tag in existing_tags if tag not in tags]
+        updated = [tag for tag in existing_tags if tag not in names]
         self._save_tag(snippet_id, updated)
         return f"Tags {tags} were removed from Snippet ID: {snippet_id}"
 
 
+class SnippetRecord(Mapping):
+    """Slotted, dict-like snippet row used by InMemoryRepository.
+
+    Tag and language strings are interned so repeated values share storage;
+    InMemoryRepository shares identical code bodies the same way by hash.
+    """
+
+    __slots__ = tuple(Snippet.model_fields)
+
+    def __init__(self, values):
+        for field in self.__slots__:
+            value = values.get(field)
+            if field in ("language", "tags") and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return f"SnippetRecord({dict(self)!r})"
+
+
+def _language_key(language):
+    return language.value if isinstance(language, Enum) else language
+
+
 class InMemoryRepository(SnippetRepository):
     def __init__(self):
         self.repository = {}
+        self.index = InvertedIndex()
+        self.ids = []
+        self.by_language = defaultdict(set)
+        self.by_favorite = defaultdict(set)
+        self.by_tag = defaultdict(set)
+        self.by_hash = defaultdict(set)
+        # Exact code string -> one shared copy, and how many snippets use it.
+        # Keyed on the raw text: code_hash ignores whitespace differences.
+        self.codes = {}
+        self.code_refs = Counter()
+        # Built on the first similar() call, then kept current by add/delete,
+        # so opening a store never pays for MinHash signatures.
+        self.similarity = None
+
+    def _index(self, id, snippet):
+        self.index.add(id, snippet["title"], snippet["description"], snippet["code"])
+        snippet_id = int(id)
+        if snippet["code_hash"] is None:
+            snippet["code_hash"] = code_hash(snippet["code"])
+        snippet["code"] = self.codes.setdefault(snippet["code"], snippet["code"])
+        self.code_refs[snippet["code"]] += 1
+        twins = self.by_hash[snippet["code_hash"]]
+        if self.similarity is not None:
+            # Code with the same hash tokenizes the same; reuse its signature.
+            twin = next((id for id in twins if id in self.similarity.signatures), None)
+            self.similarity.add(
+                snippet_id,
+                self.similarity.signature(twin)
+                if twin is not None
+                else signature(snippet["code"]),
+            )
+        twins.add(snippet_id)
+        insort(self.ids, snippet_id)
+        self.by_language[_language_key(snippet["language"])].add(snippet_id)
+        self.by_favorite[snippet["favorite"]].add(snippet_id)
+        self._index_tags(snippet_id, snippet["tags"])
+
+    def _unindex(self, id, snippet):
+        self.index.remove(id)
+        snippet_id = int(id)
+        del self.ids[bisect_left(self.ids, snippet_id)]
+        self.by_language[_language_key(snippet["language"])].discard(snippet_id)
+        self.by_favorite[snippet["favorite"]].discard(snippet_id)
+        self._unindex_tags(snippet_id, snippet["tags"])
+        if self.similarity is not None:
+            self.similarity.remove(snippet_id)
+        self.by_hash[snippet["code_hash"]].discard(snippet_id)
+        if not self.by_hash[snippet["code_hash"]]:
+            del self.by_hash[snippet["code_hash"]]
+        self.code_refs[snippet["code"]] -= 1
+        if not self.code_refs[snippet["code"]]:
+            del self.code_refs[snippet["code"]]
+            del self.codes[snippet["code"]]
+
+    def _index_tags(self, snippet_id, tags):
+        for tag in parse_tags(tags):
+            self.by_tag[sys.intern(tag)].add(snippet_id)
+
+    def _unindex_tags(self, snippet_id, tags):
+        for tag in parse_tags(tags):
+            self.by_tag[tag].discard(snippet_id)
+            if not self.by_tag[tag]:
+                del self.by_tag[tag]
+
+    def _rebuild(self, snippets):
+        self.repository = {}
+        self.index.clear()
+        self.similarity = None
+        self.ids = []
+        for index in (
+            self.by_language,
+            self.by_favorite,
+            self.by_tag,
+            self.by_hash,
+            self.codes,
+            self.code_refs,
+        ):
+            index.clear()
+        for id, snippet in snippets.items():
+            self.repository[id] = SnippetRecord(snippet)
+            self._index(id, self.repository[id])
 
-    def add(self, snippet):
-        snippet = snippet.model_dump()
-        id = str(snippet["id"])
+    def add(self, snippet, on_duplicate="allow"):
+        snippet.code_hash = code_hash(snippet.code)
+        existing = self.by_hash.get(snippet.code_hash)
+        linked = resolve_duplicate(snippet, existing and min(existing), on_duplicate)
+        if linked is not None:
+            return linked
+        if snippet.id is None:
+            snippet.id = self.ids[-1] + 1 if self.ids else 1
+        id = str(snippet.id)
         if id in self.repository:
             raise SnippetExists(id)
-        self.repository[id] = snippet
+        self.repository[id] = SnippetRecord(snippet.model_dump())
+        self._index(id, self.repository[id])
         return f"Snippet ID: {id} was created and added to the Snippet Repository"
 
+    def add_many(self, snippets):
+        results = []
+        for snippet in snippets:
+            try:
+                self.add(snippet)
+                results.append({"id": snippet.id})
+            except SnippetExists as error:
+                results.append({"error": error.message})
+        return results
+
     def all(self):
-        return [{key: value} for key, value in self.repository.items()]
+        return list(self.repository.values())
+
+    def _tagged(self, tags, match):
+        matches = [self.by_tag.get(tag, set()) for tag in tags]
+        if match == "any":
+            return set().union(*matches)
+        return set.intersection(*matches)
+
+    def page(
+        self,
+        limit,
+        cursor=None,
+        tags=None,
+        match="all",
+        columns=None,
+        language=None,
+        favorite=None,
+        created_after=None,
+        updated_after=None,
+        sort="id",
+    ):
+        field, descending = parse_sort(sort)
+        position = cursor_position(cursor, sort)
+        candidates = self._tagged(tags, match) if tags else None
+        # Narrow by the language / favorite indexes before touching records.
+        for index, key in (
+            (self.by_language, None if language is None else _language_key(language)),
+            (self.by_favorite, favorite),
+        ):
+            if key is not None:
+                ids = index.get(key, set())
+                candidates = ids if candidates is None else candidates & ids
+        if (
+            candidates is None
+            and field == "id"
+            and created_after is None
+            and updated_after is None
+        ):
+            if descending:
+                end = (
+                    len(self.ids)
+                    if position is None
+                    else bisect_left(self.ids, position[1])
+                )
+                ids = self.ids[max(0, end - limit - 1) : end][::-1]
+            else:
+                start = 0 if position is None else bisect_right(self.ids, position[1])
+                ids = self.ids[start : start + limit + 1]
+            snippets = [self.repository[str(id)] for id in ids]
+        else:
+            snippets = (
+                self.repository[str(id)]
+                for id in (self.ids if candidates is None else candidates)
+            )
+            snippets = (
+                snippet
+                for snippet in snippets
+                if matches_filters(snippet, None, None, created_after, updated_after)
+            )
+            if position is not None:
+                snippets = (
+                    snippet
+                    for snippet in snippets
+                    if after_position(sort_key(snippet, field), position, descending)
+                )
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            snippets = pick(
+                limit + 1, snippets, key=lambda snippet: sort_key(snippet, field)
+            )
+        next_cursor = None
+        if len(snippets) > limit:
+            snippets = snippets[:limit]
+            next_cursor = page_cursor(snippets[-1], sort)
+        return [project(snippet, columns) for snippet in snippets], next_cursor
+
+    def stream(self, batch_size=1000):
+        yield from list(self.repository.values())
+
+    def get(self, snippet_id, columns=None):
+        if snippet_id in self.repository:
+            return project(self.repository[snippet_id], columns)
+        return None
+
+    def get_many(self, snippet_ids, columns=None):
+        snippet_ids = list(dict.fromkeys(snippet_ids))
+        items = [
+            project(self.repository[id], columns)
+            for id in snippet_ids
+            if id in self.repository
+        ]
+        missing = [id for id in snippet_ids if id not in self.repository]
+        return items, missing
 
-    def get(self, snippet_id):
+    def get_version(self, snippet_id):
         if snippet_id in self.repository:
-            return self.repository[snippet_id]
+            return self.repository[snippet_id]["updated_at"]
         return None
 
+    def search(self, query, limit, offset=0):
+        ids = self.index.search(query, limit, offset=offset)
+        return [self.repository[id] for id in ids]
+
+    def tag_counts(self):
+        counts = {tag: len(ids) for tag, ids in self.by_tag.items()}
+        return [
+            {"tag": tag, "count": count}
+            for tag, count in sorted(
+                counts.items(), key=lambda item: (-item[1], item[0])
+            )
+        ]
+
+    def duplicates(self, limit=100):
+        groups = heapq.nsmallest(
+            limit,
+            ((hash, ids) for hash, ids in self.by_hash.items() if len(ids) > 1),
+            key=lambda group: (-len(group[1]), group[0]),
+        )
+        return [
+            {"code_hash": hash, "count": len(ids), "ids": sorted(ids)}
+            for hash, ids in groups
+        ]
+
+    def _build_similarity(self):
+        self.similarity = LSHIndex()
+        signatures = {}
+        for id, snippet in self.repository.items():
+            hash = snippet["code_hash"]
+            if hash not in signatures:
+                signatures[hash] = signature(snippet["code"])
+            self.similarity.add(int(id), signatures[hash])
+
+    def similar(self, snippet_id, limit=10, threshold=DEFAULT_THRESHOLD):
+        if str(snippet_id) not in self.repository:
+            raise SnippetNotFound(snippet_id)
+        if self.similarity is None:
+            self._build_similarity()
+        return self.similarity.similar(int(snippet_id), limit, threshold)
+
     def delete(self, snippet_id):
         if snippet_id in self.repository:
-            del self.repository[snippet_id]
+            self._unindex(snippet_id, self.repository.pop(snippet_id))
             return f"Snippet ID: {snippet_id} was deleted and removed from the Snippet Repository"
         raise SnippetNotFound(snippet_id)
 
     def toggle_favorite(self, snippet_id):
         _favorite = self.repository[snippet_id]["favorite"]
         self.repository[snippet_id]["favorite"] = not _favorite
+        self.by_favorite[_favorite].discard(int(snippet_id))
+        self.by_favorite[not _favorite].add(int(snippet_id))
         return f"Snippet ID: {snippet_id} favorite updated from {_favorite} to {self.repository[snippet_id]['favorite']}"
 
     def tag(self, snippet_id, *tags, remove=False):
@@ -115,7 +609,10 @@ class InMemoryRepository(SnippetRepository):
         return existing_tags
 
     def _save_tag(self, snippet_id, updated):
-        self.repository[snippet_id]["tags"] = ", ".join(updated)
+        snippet = self.repository[snippet_id]
+        self._unindex_tags(int(snippet_id), snippet["tags"])
+        snippet["tags"] = sys.intern(", ".join(updated))
+        self._index_tags(int(snippet_id), snippet["tags"])
 
     def _add_tag(self, snippet_id, *tags, existing_tags):
         base_result = super()._add_tag(snippet_id, *tags, existing_tags=existing_tags)
@@ -129,21 +626,270 @@ class InMemoryRepository(SnippetRepository):
 
 
 class DatastoreRepository(SnippetRepository):
-    def __init__(self, session):
+    def __init__(self, session, autocommit=True):
         self.session = session
+        # With autocommit off, mutations only flush and the caller owns the
+        # transaction (see snipster.batching.WriteBatcher).
+        self.autocommit = autocommit
+
+    def _commit(self):
+        if self.autocommit:
+            self.session.commit()
+        else:
+            self.session.flush()
+
+    def _rollback(self):
+        if self.autocommit:
+            self.session.rollback()
+
+    def _insert_ignore(self, model):
+        if self.session.get_bind().dialect.name == "postgresql":
+            return postgresql_insert(model).on_conflict_do_nothing()
+        return sqlite_insert(model).on_conflict_do_nothing()
+
+    def _advance_sequence(self):
+        # Explicit ids bypass the serial sequence, so move it past them. Only
+        # ever forward: values handed to other transactions, or above ids
+        # since deleted, must not be issued again.
+        if self.session.get_bind().dialect.name != "postgresql":
+            return
+        sequence = self.session.execute(
+            text("SELECT pg_get_serial_sequence('snippet', 'id')")
+        ).scalar()
+        self.session.execute(
+            text(
+                f"SELECT setval('{sequence}', GREATEST("
+                f"(SELECT max(id) FROM snippet), "
+                f"(SELECT last_value FROM {sequence})))"
+            )
+        )
+
+    def _claim_version(self, snippet_id, expected_version):
+        """Bump the row's ``updated_at`` if it still equals ``expected_version``.
+
+        Comparing and writing in one UPDATE means two requests holding the
+        same ETag cannot both get past the check.
+        """
+        if expected_version is None:
+            return
+        statement = (
+            update(Snippet)
+            .where(
+                Snippet.id == snippet_id,
+                Snippet.updated_at == as_utc(expected_version),
+            )
+            .values(updated_at=datetime.now(timezone.utc))
+        )
+        if self.session.execute(statement).rowcount == 0:
+            raise VersionConflict(snippet_id)
+
+    def _tag_ids(self, names):
+        if not names:
+            return {}
+        self.session.execute(
+            self._insert_ignore(Tag), [{"name": name} for name in names]
+        )
+        query = select(Tag.name, Tag.id).where(Tag.name.in_(names))
+        return dict(self.session.exec(query).all())
+
+    def _link_tags(self, tags_by_snippet):
+        names = {name for tags in tags_by_snippet.values() for name in tags}
+        tag_ids = self._tag_ids(sorted(names))
+        rows = [
+            {"snippet_id": snippet_id, "tag_id": tag_ids[name]}
+            for snippet_id, tags in tags_by_snippet.items()
+            for name in tags
+        ]
+        if rows:
+            self.session.execute(self._insert_ignore(SnippetTag), rows)
 
-    def add(self, snippet):
-        result = self.get(snippet.id)
-        if result is not None:
-            raise SnippetExists(snippet.id)
+    def _sync_tags(self, snippet_id, previous, current):
+        removed = previous - current
+        if removed:
+            self.session.execute(
+                delete(SnippetTag).where(
+                    SnippetTag.snippet_id == snippet_id,
+                    SnippetTag.tag_id.in_(select(Tag.id).where(Tag.name.in_(removed))),
+                )
+            )
+        added = current - previous
+        if added:
+            self.session.execute(
+                self._insert_ignore(Tag), [{"name": name} for name in added]
+            )
+            self.session.execute(
+                self._insert_ignore(SnippetTag).from_select(
+                    ["snippet_id", "tag_id"],
+                    select(literal(snippet_id), Tag.id).where(Tag.name.in_(added)),
+                )
+            )
+
+    def _record_changes(self, op, snippet_ids):
+        if not snippet_ids:
+            return
+        if self.session.get_bind().dialect.name == "postgresql":
+            # Serialize change-log writers until commit so sequence numbers
+            # become visible in order and readers never skip past a gap.
+            self.session.execute(text("SELECT pg_advisory_xact_lock(1936617839)"))
+        now = datetime.now(timezone.utc)
+        self.session.execute(
+            insert(SnippetChange),
+            [{"snippet_id": id, "op": op, "created_at": now} for id in snippet_ids],
+        )
+
+    def changes(self, since=0, limit=1000):
+        query = (
+            select(SnippetChange)
+            .where(SnippetChange.seq > since)
+            .order_by(SnippetChange.seq)
+            .limit(limit)
+        )
+        return [change.model_dump() for change in self.session.exec(query).all()]
+
+    def migrate_tags(self, batch_size=1000):
+        query = (
+            select(Snippet.id, Snippet.tags)
+            .where(Snippet.tags.is_not(None))
+            .order_by(Snippet.id)
+        )
+        rows = self.session.exec(query).all()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            self._link_tags({id: parse_tags(tags) for id, tags in batch})
+        self._commit()
+        return len(rows)
+
+    def _index_similarity(self, snippets):
+        signatures = {
+            id: minhash
+            for id, code in snippets
+            if (minhash := signature(code)) is not None
+        }
+        if not signatures:
+            return
+        self.session.execute(
+            self._insert_ignore(SnippetSignature),
+            [
+                {"snippet_id": id, "signature": pack_signature(minhash)}
+                for id, minhash in signatures.items()
+            ],
+        )
+        self.session.execute(
+            self._insert_ignore(SnippetBand),
+            [
+                {"snippet_id": id, "band": band, "bucket": bucket}
+                for id, minhash in signatures.items()
+                for band, bucket in band_keys(minhash)
+            ],
+        )
+
+    def migrate_similarity(self, batch_size=1000):
+        indexed = select(SnippetSignature.snippet_id)
+        query = (
+            select(Snippet.id, Snippet.code)
+            .where(Snippet.id.not_in(indexed))
+            .order_by(Snippet.id)
+        )
+        rows = self.session.exec(query).all()
+        for start in range(0, len(rows), batch_size):
+            self._index_similarity(rows[start : start + batch_size])
+        self._commit()
+        return len(rows)
 
-        self.session.add(snippet)
-        self.session.commit()
-        self.session.refresh(snippet)
+    def migrate_code_hashes(self, batch_size=1000):
+        query = (
+            select(Snippet.id, Snippet.code)
+            .where(Snippet.code_hash.is_(None))
+            .order_by(Snippet.id)
+        )
+        rows = self.session.exec(query).all()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            self.session.execute(
+                update(Snippet),
+                [{"id": id, "code_hash": code_hash(code)} for id, code in batch],
+            )
+        self._commit()
+        return len(rows)
+
+    def add(self, snippet, on_duplicate="allow"):
+        snippet.code_hash = code_hash(snippet.code)
+        if on_duplicate != "allow":
+            query = select(func.min(Snippet.id)).where(
+                Snippet.code_hash == snippet.code_hash
+            )
+            existing = self.session.exec(query).one()
+            linked = resolve_duplicate(snippet, existing, on_duplicate)
+            if linked is not None:
+                return linked
+        if snippet.id is None:
+            statement = insert(Snippet).values(**snippet.model_dump(exclude={"id"}))
+            id = self.session.execute(statement.returning(Snippet.id)).scalar()
+        else:
+            # A caller-supplied id that is taken returns no row instead of
+            # raising.
+            statement = self._insert_ignore(Snippet).values(**snippet.model_dump())
+            id = self.session.execute(statement.returning(Snippet.id)).scalar()
+            if id is None:
+                raise SnippetExists(snippet.id)
+            self._advance_sequence()
+        snippet.id = id
+        self._link_tags({id: parse_tags(snippet.tags)})
+        self._index_similarity([(id, snippet.code)])
+        self._record_changes("add", [id])
+        self._commit()
         return (
             f"Snippet ID: {snippet.id} was created and added to the Snippet Repository"
         )
 
+    def add_many(self, snippets):
+        for snippet in snippets:
+            snippet.code_hash = code_hash(snippet.code)
+        explicit = [snippet.id for snippet in snippets if snippet.id is not None]
+        taken = set()
+        if explicit:
+            query = select(Snippet.id).where(Snippet.id.in_(explicit))
+            taken = set(self.session.exec(query).all())
+
+        results = [None] * len(snippets)
+        generated, provided = [], []
+        for index, snippet in enumerate(snippets):
+            if snippet.id is None:
+                generated.append(index)
+            elif snippet.id in taken:
+                results[index] = {"error": SnippetExists(snippet.id).message}
+            else:
+                taken.add(snippet.id)
+                provided.append(index)
+
+        statement = insert(Snippet).returning(Snippet.id, sort_by_parameter_order=True)
+        # Explicit ids go first so generated ids are allocated past them.
+        for indexes, exclude in ((provided, set()), (generated, {"id"})):
+            if not indexes:
+                continue
+            rows = [snippets[index].model_dump(exclude=exclude) for index in indexes]
+            ids = self.session.execute(statement, rows).scalars().all()
+            for index, id in zip(indexes, ids):
+                snippets[index].id = id
+                results[index] = {"id": id}
+            self._link_tags(
+                {
+                    snippets[index].id: parse_tags(snippets[index].tags)
+                    for index in indexes
+                }
+            )
+            self._index_similarity(
+                (snippets[index].id, snippets[index].code) for index in indexes
+            )
+            if not exclude:
+                self._advance_sequence()
+
+        self._record_changes(
+            "add", [result["id"] for result in results if "id" in result]
+        )
+        self._commit()
+        return results
+
     def all(self):
         query = select(Snippet)
         result = self.session.exec(query).all()
@@ -151,25 +897,227 @@ class DatastoreRepository(SnippetRepository):
             result = [row.model_dump() for row in result]
             return result
 
-    def get(self, snippet_id):
-        query = select(Snippet).where(Snippet.id == snippet_id)
-        result = self.session.exec(query).first()
+    def _select(self, columns):
+        if columns is None:
+            return select(Snippet)
+        return select(*(getattr(Snippet, column) for column in columns))
+
+    def _rows(self, query, columns):
+        if columns is None:
+            return [row.model_dump() for row in self.session.exec(query)]
+        return [dict(row._mapping) for row in self.session.execute(query)]
+
+    def page(
+        self,
+        limit,
+        cursor=None,
+        tags=None,
+        match="all",
+        columns=None,
+        language=None,
+        favorite=None,
+        created_after=None,
+        updated_after=None,
+        sort="id",
+    ):
+        field, descending = parse_sort(sort)
+        position = cursor_position(cursor, sort)
+        selected = columns
+        if columns is not None and field not in columns:
+            selected = [*columns, field]
+        order = [getattr(Snippet, field), Snippet.id] if field != "id" else [Snippet.id]
+        if descending:
+            order = [expression.desc() for expression in order]
+        query = self._select(selected).order_by(*order).limit(limit + 1)
+        if position is not None:
+            key, after = position
+            if field == "id":
+                after_key = Snippet.id < after if descending else Snippet.id > after
+            else:
+                # Row-value comparison lets (column, id) indexes serve keyset paging.
+                keyset = tuple_(getattr(Snippet, field), Snippet.id)
+                bound = tuple_(
+                    literal(key, getattr(Snippet, field).type),
+                    literal(after),
+                )
+                after_key = keyset < bound if descending else keyset > bound
+            query = query.where(after_key)
+        if language is not None:
+            query = query.where(Snippet.language == Language(_language_key(language)))
+        if favorite is not None:
+            query = query.where(Snippet.favorite == favorite)
+        if created_after is not None:
+            query = query.where(Snippet.created_at > as_utc(created_after))
+        if updated_after is not None:
+            query = query.where(Snippet.updated_at > as_utc(updated_after))
+        if tags:
+            names = set(tags)
+            tagged = (
+                select(SnippetTag.snippet_id)
+                .join(Tag, Tag.id == SnippetTag.tag_id)
+                .where(Tag.name.in_(names))
+            )
+            if match == "all":
+                tagged = tagged.group_by(SnippetTag.snippet_id).having(
+                    func.count() == len(names)
+                )
+            query = query.where(Snippet.id.in_(tagged))
+        result = self._rows(query, selected)
+        next_cursor = None
+        if len(result) > limit:
+            result = result[:limit]
+            next_cursor = page_cursor(result[-1], sort)
+        if selected is not columns:
+            result = [project(row, columns) for row in result]
+        return result, next_cursor
+
+    def stream(self, batch_size=1000):
+        # A dedicated session keeps the server-side cursor alive for as long as
+        # the consumer iterates, independent of the request-scoped session.
+        query = (
+            select(Snippet).order_by(Snippet.id).execution_options(yield_per=batch_size)
+        )
+        with Session(self.session.get_bind()) as session:
+            for row in session.exec(query):
+                yield row.model_dump()
+
+    def get(self, snippet_id, columns=None):
+        query = self._select(columns).where(Snippet.id == snippet_id)
+        result = self._rows(query, columns)
         if result:
-            return result.model_dump()
+            return result[0]
 
-    def delete(self, snippet_id):
+    def get_many(self, snippet_ids, columns=None):
+        snippet_ids = list(dict.fromkeys(snippet_ids))
+        query = self._select(columns).where(Snippet.id.in_(snippet_ids))
+        found = {row["id"]: row for row in self._rows(query, columns)}
+        items = [found[id] for id in snippet_ids if id in found]
+        missing = [id for id in snippet_ids if id not in found]
+        return items, missing
+
+    def get_version(self, snippet_id):
+        query = select(Snippet.updated_at).where(Snippet.id == snippet_id)
+        return self.session.exec(query).first()
+
+    def search(self, query, limit, offset=0):
+        if self.session.get_bind().dialect.name == "sqlite":
+            terms = " ".join(f'"{token}"' for token in tokenize(query))
+            if not terms:
+                return []
+            fts = table("snippet_fts", column("rowid"))
+            statement = (
+                select(Snippet)
+                .join(fts, fts.c.rowid == Snippet.id)
+                .where(text("snippet_fts MATCH :terms").bindparams(terms=terms))
+                .order_by(text("snippet_fts.rank"), Snippet.id)
+            )
+        else:
+            vector = literal_column("snippet.search_vector")
+            tsquery = func.websearch_to_tsquery("english", query)
+            statement = (
+                select(Snippet)
+                .where(vector.op("@@")(tsquery))
+                .order_by(func.ts_rank_cd(vector, tsquery).desc(), Snippet.id)
+            )
+        result = self.session.exec(statement.limit(limit).offset(offset)).all()
+        return [row.model_dump() for row in result]
+
+    def tag_counts(self):
+        count = func.count(SnippetTag.snippet_id)
+        query = (
+            select(Tag.name, count)
+            .join(SnippetTag, SnippetTag.tag_id == Tag.id)
+            .group_by(Tag.name)
+            .order_by(count.desc(), Tag.name)
+        )
+        return [
+            {"tag": name, "count": total} for name, total in self.session.exec(query)
+        ]
+
+    def duplicates(self, limit=100):
+        # Both queries are lookups on ix_snippet_code_hash, not a pairwise scan.
+        count = func.count()
+        query = (
+            select(Snippet.code_hash, count)
+            .where(Snippet.code_hash.is_not(None))
+            .group_by(Snippet.code_hash)
+            .having(count > 1)
+            .order_by(count.desc(), Snippet.code_hash)
+            .limit(limit)
+        )
+        groups = self.session.exec(query).all()
+        ids = defaultdict(list)
+        if groups:
+            query = (
+                select(Snippet.code_hash, Snippet.id)
+                .where(Snippet.code_hash.in_([hash for hash, _ in groups]))
+                .order_by(Snippet.id)
+            )
+            for hash, id in self.session.exec(query):
+                ids[hash].append(id)
+        return [
+            {"code_hash": hash, "count": total, "ids": ids[hash]}
+            for hash, total in groups
+        ]
+
+    def similar(self, snippet_id, limit=10, threshold=DEFAULT_THRESHOLD):
+        query = (
+            select(Snippet.id, SnippetSignature.signature)
+            .outerjoin(SnippetSignature, SnippetSignature.snippet_id == Snippet.id)
+            .where(Snippet.id == snippet_id)
+        )
+        row = self.session.exec(query).first()
+        if row is None:
+            raise SnippetNotFound(snippet_id)
+        if row.signature is None:
+            return []
+        target = unpack_signature(row.signature)
+        # Only the snippets sharing the most buckets are read back and scored,
+        # from their stored signatures.
+        keys = list(band_keys(target))
+        hits = func.count()
+        matched = (
+            select(SnippetBand.snippet_id)
+            .where(
+                tuple_(SnippetBand.band, SnippetBand.bucket).in_(keys),
+                SnippetBand.snippet_id != snippet_id,
+            )
+            .group_by(SnippetBand.snippet_id)
+            .order_by(hits.desc(), SnippetBand.snippet_id)
+            .limit(MAX_CANDIDATES)
+            .subquery()
+        )
+        query = select(SnippetSignature.snippet_id, SnippetSignature.signature).join(
+            matched, matched.c.snippet_id == SnippetSignature.snippet_id
+        )
+        candidates = [
+            (id, unpack_signature(data)) for id, data in self.session.exec(query)
+        ]
+        return rank(target, candidates, limit, threshold)
+
+    def delete(self, snippet_id, expected_version=None):
+        self._claim_version(snippet_id, expected_version)
         query = select(Snippet).where(Snippet.id == snippet_id)
         result = self.session.exec(query).first()
         if result:
             id = result.id
+            self.session.execute(delete(SnippetTag).where(SnippetTag.snippet_id == id))
+            self.session.execute(
+                delete(SnippetBand).where(SnippetBand.snippet_id == id)
+            )
+            self.session.execute(
+                delete(SnippetSignature).where(SnippetSignature.snippet_id == id)
+            )
             self.session.delete(result)
-            self.session.commit()
+            self._record_changes("delete", [id])
+            self._commit()
             return (
                 f"Snippet ID: {id} was deleted and removed from the Snippet Repository"
             )
         raise SnippetNotFound(snippet_id)
 
-    def toggle_favorite(self, snippet_id):
+    def toggle_favorite(self, snippet_id, expected_version=None):
+        self._claim_version(snippet_id, expected_version)
         query = select(Snippet).where(Snippet.id == snippet_id)
         result = self.session.exec(query).first()
         if result:
@@ -177,14 +1125,37 @@ class DatastoreRepository(SnippetRepository):
             result.favorite = not result.favorite
             result.updated_at = datetime.now(timezone.utc)
             self.session.add(result)
-            self.session.commit()
+            self._record_changes("favorite", [result.id])
+            self._commit()
             self.session.refresh(result)
             return f"Snippet ID: {result.id} favorite updated from {_favorite} to {result.favorite}"
         raise SnippetNotFound(snippet_id)
 
     def tag(self, snippet_id, *tags, remove=False):
-        base_result = super().tag(snippet_id, *tags, remove=remove)
-        return f"{base_result}"
+        return self.update_tags(snippet_id, *tags, remove=remove)["message"]
+
+    def update_tags(self, snippet_id, *tags, remove=False, expected_version=None):
+        self._claim_version(snippet_id, expected_version)
+        # The row lock is held from the read of the current tags until commit,
+        # so concurrent tag changes on the same snippet serialize instead of
+        # overwriting each other.
+        result = self.session.get(Snippet, snippet_id, with_for_update=True)
+        if result is None:
+            raise SnippetNotFound(snippet_id)
+        existing_tags = parse_tags(result.tags)
+        try:
+            if remove:
+                message = self._remove_tag(
+                    snippet_id, *tags, existing_tags=existing_tags
+                )
+            else:
+                message = self._add_tag(snippet_id, *tags, existing_tags=existing_tags)
+        except (TagExists, TagNotFound, NoTagsPresent):
+            self._rollback()
+            raise
+        updated = parse_tags(result.tags)
+        self._commit()
+        return {"message": message, "tags": updated}
 
     def _existing_tag(self, snippet_id, *tags, remove=False):
         query = select(Snippet).where(Snippet.id == snippet_id)
@@ -193,13 +1164,13 @@ class DatastoreRepository(SnippetRepository):
         return existing_tags
 
     def _save_tag(self, snippet_id, updated):
-        query = select(Snippet).where(Snippet.id == snippet_id)
-        result = self.session.exec(query).first()
+        result = self.session.get(Snippet, snippet_id)
+        previous = set(parse_tags(result.tags))
         result.tags = ", ".join(updated)
         result.updated_at = datetime.now(timezone.utc)
         self.session.add(result)
-        self.session.commit()
-        self.session.refresh(result)
+        self._sync_tags(snippet_id, previous, set(parse_tags(result.tags)))
+        self._record_changes("tags", [snippet_id])
 
     def _add_tag(self, snippet_id, *tags, existing_tags):
         base_result = super()._add_tag(snippet_id, *tags, existing_tags=existing_tags)
@@ -212,13 +1183,127 @@ class DatastoreRepository(SnippetRepository):
         return f"{base_result}"
 
 
-class CustomEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Enum):
-            return obj.value
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+class AsyncDatastoreRepository:
+    """Awaitable counterpart of DatastoreRepository for an AsyncSession.
+
+    Each call runs the synchronous repository logic through
+    ``AsyncSession.run_sync``, so queries go out over the async driver while
+    the SnippetRepository semantics stay defined in one place. Mutations go
+    through ``batcher`` instead when one is given.
+    """
+
+    def __init__(self, session, wrap=None, batcher=None):
+        self.session = session
+        self.wrap = wrap or (lambda repository: repository)
+        self.batcher = batcher
+
+    async def release(self):
+        """End the session's transaction and return its connection to the pool.
+
+        The session stays usable; the next call checks a connection out again.
+        """
+        await self.session.close()
+
+    async def run(self, function, *args, **kwargs):
+        def call(session):
+            return function(self.wrap(DatastoreRepository(session)), *args, **kwargs)
+
+        return await self.session.run_sync(call)
+
+    async def _call(self, method, *args, **kwargs):
+        with timed(method):
+            return await self.run(
+                lambda repository: getattr(repository, method)(*args, **kwargs)
+            )
+
+    async def _write(self, method, *args, **kwargs):
+        if self.batcher is None:
+            return await self._call(method, *args, **kwargs)
+        with timed(method):
+            future = self.batcher.submit(method, *args, **kwargs)
+            return await asyncio.wrap_future(future)
+
+    async def add(self, snippet, on_duplicate="allow"):
+        return await self._write("add", snippet, on_duplicate=on_duplicate)
+
+    async def add_many(self, snippets):
+        return await self._write("add_many", snippets)
+
+    async def all(self):
+        return await self._call("all")
+
+    async def page(
+        self,
+        limit,
+        cursor=None,
+        tags=None,
+        match="all",
+        columns=None,
+        language=None,
+        favorite=None,
+        created_after=None,
+        updated_after=None,
+        sort="id",
+    ):
+        return await self._call(
+            "page",
+            limit,
+            cursor=cursor,
+            tags=tags,
+            match=match,
+            columns=columns,
+            language=language,
+            favorite=favorite,
+            created_after=created_after,
+            updated_after=updated_after,
+            sort=sort,
+        )
+
+    async def get(self, snippet_id, columns=None):
+        return await self._call("get", snippet_id, columns=columns)
+
+    async def get_many(self, snippet_ids, columns=None):
+        return await self._call("get_many", snippet_ids, columns=columns)
+
+    async def get_version(self, snippet_id):
+        return await self._call("get_version", snippet_id)
+
+    async def changes(self, since=0, limit=1000):
+        return await self._call("changes", since=since, limit=limit)
+
+    async def search(self, query, limit, offset=0):
+        return await self._call("search", query, limit, offset=offset)
+
+    async def tag_counts(self):
+        return await self._call("tag_counts")
+
+    async def duplicates(self, limit=100):
+        return await self._call("duplicates", limit=limit)
+
+    async def similar(self, snippet_id, limit=10, threshold=DEFAULT_THRESHOLD):
+        return await self._call("similar", snippet_id, limit=limit, threshold=threshold)
+
+    async def delete(self, snippet_id, expected_version=None):
+        return await self._write(
+            "delete", snippet_id, expected_version=expected_version
+        )
+
+    async def toggle_favorite(self, snippet_id, expected_version=None):
+        return await self._write(
+            "toggle_favorite", snippet_id, expected_version=expected_version
+        )
+
+    async def tag(self, snippet_id, *tags, remove=False):
+        return await self._write("tag", snippet_id, *tags, remove=remove)
+
+    async def update_tags(self, snippet_id, *tags, remove=False, expected_version=None):
+        return await self._write(
+            "update_tags",
+            snippet_id,
+            *tags,
+            remove=remove,
+            expected_version=expected_version,
+        )
 
 
 class JSONRepository(InMemoryRepository):
@@ -226,11 +1311,117 @@ class JSONRepository(InMemoryRepository):
         super().__init__()
         self.file = file
 
+    def _load(self):
+        with open(self.file, "rb") as file:
+            return loads(file.read())
+
+    def _write_snapshot(self):
+        # Write beside the target and rename over it, so a crash mid-write
+        # leaves the previous snapshot intact.
+        temporary = f"{self.file}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(dumps(self.repository))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.file)
+
+    def __enter__(self):
+        self._rebuild(self._load())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._write_snapshot()
+
+
+class JournaledJSONRepository(JSONRepository):
+    """JSONRepository that appends each mutation to a journal file.
+
+    The snapshot at ``file`` is only rewritten when the journal reaches
+    ``compact_every`` entries; startup loads the snapshot and replays the
+    journal written since.
+    """
+
+    def __init__(self, file, compact_every=1000, fsync=False):
+        super().__init__(file)
+        self.journal_file = f"{file}.journal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.journal = None
+        self.journal_entries = 0
+
+    def _load(self):
+        repository = super()._load() if os.path.exists(self.file) else {}
+        self.journal_entries = 0
+        if not os.path.exists(self.journal_file):
+            return repository
+        with open(self.journal_file, "rb+") as file:
+            valid = 0
+            for line in file:
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append; drop it so
+                    # new entries are not appended onto the fragment.
+                    file.truncate(valid)
+                    break
+                self._replay(repository, entry)
+                self.journal_entries += 1
+                valid += len(line)
+        return repository
+
+    def _replay(self, repository, entry):
+        if entry["op"] == "add":
+            repository[str(entry["snippet"]["id"])] = entry["snippet"]
+        elif entry["op"] == "delete":
+            repository.pop(entry["id"], None)
+        elif entry["op"] == "update" and entry["id"] in repository:
+            repository[entry["id"]].update(entry["fields"])
+
+    def _append(self, entry):
+        self.journal.write(dumps(entry) + b"\n")
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.journal_entries += 1
+        if self.journal_entries >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        self._write_snapshot()
+        self.journal.truncate(0)
+        self.journal.seek(0)
+        self.journal_entries = 0
+
     def __enter__(self):
-        with open(self.file) as file:
-            self.repository = json.load(file)
+        super().__enter__()
+        self.journal = open(self.journal_file, "ab")
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        with open(self.file, "w") as file:
-            json.dump(self.repository, file, cls=CustomEncoder)
+        self.journal.close()
+        self.journal = None
+
+    def add(self, snippet, on_duplicate="allow"):
+        size = len(self.repository)
+        result = super().add(snippet, on_duplicate)
+        if len(self.repository) > size:  # a linked duplicate adds nothing
+            self._append({"op": "add", "snippet": snippet.model_dump()})
+        return result
+
+    def delete(self, snippet_id):
+        result = super().delete(snippet_id)
+        self._append({"op": "delete", "id": snippet_id})
+        return result
+
+    def toggle_favorite(self, snippet_id):
+        result = super().toggle_favorite(snippet_id)
+        favorite = self.repository[snippet_id]["favorite"]
+        self._append(
+            {"op": "update", "id": snippet_id, "fields": {"favorite": favorite}}
+        )
+        return result
+
+    def _save_tag(self, snippet_id, updated):
+        super()._save_tag(snippet_id, updated)
+        tags = self.repository[snippet_id]["tags"]
+        self._append({"op": "update", "id": snippet_id, "fields": {"tags": tags}})
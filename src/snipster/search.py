@@ -0,0 +1,55 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+
+    def add(self, document_id, *texts):
+        self.remove(document_id)
+        counts = Counter(token for text in texts for token in tokenize(text))
+        for token, count in counts.items():
+            self.postings[token][document_id] = count
+        self.documents[document_id] = tuple(counts)
+
+    def remove(self, document_id):
+        for token in self.documents.pop(document_id, ()):
+            postings = self.postings[token]
+            del postings[document_id]
+            if not postings:
+                del self.postings[token]
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+
+    def search(self, query, limit, offset=0):
+        tokens = set(tokenize(query))
+        if not tokens or any(token not in self.postings for token in tokens):
+            return []
+
+        postings = sorted((self.postings[token] for token in tokens), key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        total = len(self.documents)
+        weights = [math.log(1 + total / len(posting)) for posting in postings]
+
+        def score(document_id):
+            return sum(
+                weight * posting[document_id]
+                for weight, posting in zip(weights, postings)
+            )
+
+        ranked = heapq.nlargest(offset + limit, sorted(matches), key=score)
+        return ranked[offset:]
@@ -0,0 +1,17 @@
+from collections.abc import Mapping
+
+import orjson
+
+
+def _default(obj):
+    # orjson handles datetimes and enums natively; this only sees the rest.
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    return orjson.dumps(obj, default=_default)
+
+
+loads = orjson.loads
@@ -0,0 +1,165 @@
+"""MinHash signatures and LSH buckets for finding near-duplicate code.
+
+Code is tokenized with identifiers collapsed to a single placeholder, so
+renamed variables and reformatting leave a snippet's shingles unchanged.
+Snippets whose signatures agree on every row of at least one band share a
+bucket and become candidates; only those candidates are scored.
+"""
+
+import hashlib
+import heapq
+import random
+import re
+import struct
+from collections import defaultdict
+
+from snipster.constants import DEFAULT_THRESHOLD
+
+SHINGLE_SIZE = 5
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+# Most candidates DatastoreRepository.similar reads back, by shared bands.
+MAX_CANDIDATES = 1000
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(0x5EED)
+# Fixed seed: signatures stored by DatastoreRepository must stay comparable.
+PERMUTATIONS = [
+    (_random.randrange(1, _PRIME), _random.randrange(0, _PRIME))
+    for _ in range(NUM_PERM)
+]
+
+SIGNATURE = struct.Struct(f"<{NUM_PERM}Q")
+
+CODE_TOKEN = re.compile(r"[A-Za-z_]\w*|\d+(?:\.\d+)?|\S")
+KEYWORDS = frozenset(
+    """
+    and as async await break case catch class const continue def default defer
+    del delete elif else enum except export extends false finally fn for from
+    func function go if impl import in interface is let loop match mod mut new
+    none nil not null or package pub raise return select self static struct
+    switch this throw trait true try type typeof use var where while with yield
+    begin commit create end exception group having insert into join limit
+    order procedure update values
+    """.split()
+)
+
+
+def code_tokens(code):
+    tokens = []
+    for token in CODE_TOKEN.findall(code or ""):
+        if (token[0].isalpha() or token[0] == "_") and token.lower() not in KEYWORDS:
+            token = "$"
+        tokens.append(token)
+    return tokens
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def shingles(code):
+    tokens = code_tokens(code)
+    windows = range(max(1, len(tokens) - SHINGLE_SIZE + 1)) if tokens else ()
+    return {
+        _hash64("\x1f".join(tokens[start : start + SHINGLE_SIZE]).encode())
+        for start in windows
+    }
+
+
+def minhash(values):
+    if not values:
+        return None
+    return tuple(min((a * x + b) % _PRIME for x in values) for a, b in PERMUTATIONS)
+
+
+def signature(code):
+    """MinHash signature of ``code``, or None when it has no tokens."""
+    return minhash(shingles(code))
+
+
+def pack_signature(signature):
+    return SIGNATURE.pack(*signature)
+
+
+def unpack_signature(data):
+    return SIGNATURE.unpack(data)
+
+
+def band_keys(signature):
+    """Yield ``(band, bucket)`` pairs; buckets are signed 64-bit integers."""
+    for band in range(BANDS):
+        rows = signature[band * ROWS : (band + 1) * ROWS]
+        data = b"".join(row.to_bytes(8, "little") for row in rows)
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        yield band, int.from_bytes(digest, "little", signed=True)
+
+
+def estimate(first, second):
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def rank(target, candidates, limit, threshold=DEFAULT_THRESHOLD):
+    """Score ``(id, signature)`` candidates against ``target``."""
+    scored = (
+        (id, estimate(target, candidate))
+        for id, candidate in candidates
+        if candidate is not None
+    )
+    best = heapq.nsmallest(
+        limit,
+        (item for item in scored if item[1] >= threshold),
+        key=lambda item: (-item[1], item[0]),
+    )
+    return [{"id": id, "similarity": round(score, 4)} for id, score in best]
+
+
+class LSHIndex:
+    """In-memory LSH buckets; signatures are kept packed (see pack_signature)."""
+
+    def __init__(self):
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+
+    def signature(self, document_id):
+        data = self.signatures.get(document_id)
+        return unpack_signature(data) if data is not None else None
+
+    def add(self, document_id, signature):
+        self.remove(document_id)
+        if signature is None:
+            return
+        self.signatures[document_id] = pack_signature(signature)
+        for key in band_keys(signature):
+            self.buckets[key].add(document_id)
+
+    def remove(self, document_id):
+        signature = self.signature(document_id)
+        if signature is None:
+            return
+        del self.signatures[document_id]
+        for key in band_keys(signature):
+            bucket = self.buckets[key]
+            bucket.discard(document_id)
+            if not bucket:
+                del self.buckets[key]
+
+    def clear(self):
+        self.buckets.clear()
+        self.signatures.clear()
+
+    def similar(self, document_id, limit, threshold=DEFAULT_THRESHOLD):
+        target = self.signature(document_id)
+        if target is None:
+            return []
+        candidates = set().union(
+            *(self.buckets.get(key, ()) for key in band_keys(target))
+        )
+        candidates.discard(document_id)
+        return rank(
+            target,
+            ((id, self.signature(id)) for id in candidates),
+            limit,
+            threshold,
+        )
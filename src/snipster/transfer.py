@@ -0,0 +1,82 @@
+import json
+from itertools import chain, islice
+
+from pydantic import ValidationError
+
+from snipster.models import Snippet, SnippetImport
+from snipster.serialization import dumps
+
+EXPORT_CHUNK_SIZE = 500
+IMPORT_CHUNK_SIZE = 1000
+
+
+def to_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    lines = []
+    for row in rows:
+        lines.append(dumps(row).decode())
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def read_records(lines):
+    lines = iter(lines)
+    first = next((line for line in lines if line.strip()), None)
+    if first is None:
+        return
+    if first.lstrip().startswith("["):
+        try:
+            records = json.loads(first + "".join(lines))
+        except ValueError as error:
+            yield 0, error
+            return
+        yield from enumerate(records)
+        return
+    records = (line for line in chain([first], lines) if line.strip())
+    for index, line in enumerate(records):
+        try:
+            yield index, json.loads(line)
+        except ValueError as error:
+            yield index, error
+
+
+def _error_message(error):
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    return str(error)
+
+
+def _to_snippet(record):
+    values = SnippetImport.model_validate(record).model_dump()
+    for field in ("id", "created_at", "updated_at"):
+        if values[field] is None:
+            del values[field]
+    return Snippet(**values)
+
+
+def import_snippets(repo, records, chunk_size=IMPORT_CHUNK_SIZE):
+    report = {"created": [], "errors": []}
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        indexes, snippets = [], []
+        for index, record in chunk:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                snippets.append(_to_snippet(record))
+                indexes.append(index)
+            except (ValueError, TypeError) as error:
+                report["errors"].append(
+                    {"index": index, "error": _error_message(error)}
+                )
+        for index, result in zip(indexes, repo.add_many(snippets)):
+            if "error" in result:
+                report["errors"].append({"index": index, "error": result["error"]})
+            else:
+                report["created"].append(result["id"])
+    return report
@@ -1,10 +1,17 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from snipster.api import app, get_repo
+from snipster.api import app, get_async_repo, get_repo
 from snipster.models import Language, Snippet
-from snipster.repo import DatastoreRepository, InMemoryRepository
+from snipster.repo import (
+    AsyncDatastoreRepository,
+    DatastoreRepository,
+    InMemoryRepository,
+)
 
 
 @pytest.fixture(scope="function")
@@ -17,6 +24,19 @@ def test_engine(tmp_path):
     yield engine
 
 
+@pytest.fixture()
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="function")
+def test_async_engine(tmp_path, test_engine):
+    # TestClient runs every request on a fresh event loop, so connections
+    # must not be pooled across requests.
+    db_file = tmp_path / "test.db"
+    return create_async_engine(f"sqlite+aiosqlite:///{db_file}", poolclass=NullPool)
+
+
 @pytest.fixture(scope="function")
 def session(test_engine):
     with Session(test_engine) as session:
@@ -67,10 +87,35 @@ def temp_json_file(tmp_path):
 
 
 @pytest.fixture()
-def fastapi_client(session):
+def fastapi_client(session, test_async_engine):
     def override_repo():
         return DatastoreRepository(session)
 
+    async def override_async_repo():
+        async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
+            yield AsyncDatastoreRepository(session)
+
     app.dependency_overrides[get_repo] = override_repo
+    app.dependency_overrides[get_async_repo] = override_async_repo
     client = TestClient(app)
     return client
+
+
+@pytest.fixture(scope="function")
+def post_snippet(fastapi_client):
+    """POST ``snippet`` to /snippets/ with query ``params``, ``fields`` overriding."""
+
+    def post(snippet, params=None, **fields):
+        payload = {
+            "title": snippet.title,
+            "code": snippet.code,
+            "description": snippet.description,
+            "language": snippet.language.value,
+            "tags": snippet.tags,
+            "favorite": snippet.favorite,
+        }
+        return fastapi_client.post(
+            "/snippets/", params=params, json={**payload, **fields}
+        )
+
+    return post
@@ -1,3 +1,18 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from snipster import metrics
+from snipster.api import app, change_events, get_async_repo
+from snipster.cache import CachedRepository, SnippetCache
+from snipster.conditional import snippet_etag
+from snipster.models import Language
+from snipster.repo import AsyncDatastoreRepository
+
+
 def test_create_snippet(fastapi_client):
     response = fastapi_client.post(
         "/snippets/",
@@ -62,6 +77,9 @@ def test_get_snippet(fastapi_client, snippet_one):
     assert response.json()["id"] == 1
     assert response.json()["title"] == "first snippet"
 
+    response = fastapi_client.get("/snippets/99")
+    assert response.status_code == 404
+
 
 def test_delete_snippet(fastapi_client, snippet_two):
     response = fastapi_client.post(
@@ -120,6 +138,7 @@ def test_tag(fastapi_client, snippet_one):
         tag_response.json()["message"]
         == "Tags ('python, print',) were added for Snippet ID: 1"
     )
+    assert tag_response.json()["tags"] == ["python", "print"]
     tag_response = fastapi_client.post(
         f"/snippets/{response.json()['id']}/tags?tags=print&remove=true"
     )
@@ -127,3 +146,311 @@ def test_tag(fastapi_client, snippet_one):
         tag_response.json()["message"]
         == "Tags ('print',) were removed from Snippet ID: 1"
     )
+
+
+def test_pool_status():
+    with TestClient(app) as client:
+        response = client.get("/health/pool")
+        assert response.status_code == 200
+        keys = {"size", "checked_in", "checked_out", "overflow"}
+        assert set(response.json()) == keys | {f"sync_{key}" for key in keys}
+
+
+def test_batcher_status_disabled(fastapi_client):
+    response = fastapi_client.get("/health/batcher")
+    assert response.json() == {"enabled": False}
+
+
+def test_get_snippets_paginated(fastapi_client, post_snippet, snippet_one, snippet_two):
+    for snippet in [snippet_one, snippet_two]:
+        post_snippet(snippet)
+    response = fastapi_client.get("/snippets/?limit=1")
+    assert [snippet["id"] for snippet in response.json()] == [1]
+    cursor = response.headers["X-Next-Cursor"]
+    response = fastapi_client.get(f"/snippets/?limit=1&cursor={cursor}")
+    assert [snippet["id"] for snippet in response.json()] == [2]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = fastapi_client.get("/snippets/?cursor=bogus")
+    assert response.status_code == 400
+
+
+def test_export_snippets(fastapi_client, post_snippet, snippet_one, snippet_two):
+    for snippet in [snippet_one, snippet_two]:
+        post_snippet(snippet)
+    response = fastapi_client.get("/snippets/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["title"] for row in rows] == ["first snippet", "second snippet"]
+    assert rows[0]["language"] == "python"
+
+
+def test_bulk_create_snippets(fastapi_client):
+    records = [
+        {"title": "one", "code": "pass", "language": "python"},
+        {"title": "two", "code": "pass", "language": "coffeescript"},
+    ]
+    response = fastapi_client.post("/snippets/bulk", content=json.dumps(records))
+    assert response.status_code == 200
+    assert response.json()["created"] == [1]
+    assert response.json()["errors"][0]["index"] == 1
+
+    ndjson = '{"title": "three", "code": "pass", "language": "go"}\nnot json\n'
+    response = fastapi_client.post(
+        "/snippets/bulk",
+        content=ndjson,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.json()["created"] == [2]
+    assert [error["index"] for error in response.json()["errors"]] == [1]
+
+
+def test_search_snippets(fastapi_client, post_snippet, snippet_one, snippet_two):
+    for snippet in [snippet_one, snippet_two]:
+        post_snippet(snippet)
+    response = fastapi_client.get("/snippets/search?q=bulldogs")
+    assert response.status_code == 200
+    assert [snippet["id"] for snippet in response.json()] == [2]
+
+
+def test_get_snippets_by_tag(fastapi_client, post_snippet, snippet_one, snippet_two):
+    for snippet, tags in [(snippet_one, "python, print"), (snippet_two, "python")]:
+        post_snippet(snippet, tags=tags)
+    response = fastapi_client.get("/snippets/?tag=python&tag=print")
+    assert [snippet["id"] for snippet in response.json()] == [1]
+    response = fastapi_client.get("/snippets/?tag=print&tag=go&match=any")
+    assert [snippet["id"] for snippet in response.json()] == [1]
+
+    response = fastapi_client.get("/tags/")
+    assert response.json() == [
+        {"tag": "python", "count": 2},
+        {"tag": "print", "count": 1},
+    ]
+
+
+def test_get_snippet_batch(fastapi_client, post_snippet, snippet_one):
+    post_snippet(snippet_one)
+    response = fastapi_client.get("/snippets/batch?ids=1,2")
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["items"]] == [1]
+    assert response.json()["missing"] == [2]
+
+    response = fastapi_client.get("/snippets/batch?ids=1,two")
+    assert response.status_code == 422
+
+
+def test_sparse_fields(fastapi_client, post_snippet, snippet_one, snippet_two):
+    for snippet in [snippet_one, snippet_two]:
+        post_snippet(snippet)
+    response = fastapi_client.get("/snippets/?fields=title&limit=1")
+    assert response.json() == [{"id": 1, "title": "first snippet"}]
+    assert "X-Next-Cursor" in response.headers
+
+    response = fastapi_client.get("/snippets/2?fields=title,language")
+    assert response.json() == {"id": 2, "title": "second snippet", "language": "python"}
+
+    response = fastapi_client.get("/snippets/batch?ids=1&fields=favorite")
+    assert response.json()["items"] == [{"id": 1, "favorite": True}]
+
+    response = fastapi_client.get("/snippets/?fields=title,secret")
+    assert response.status_code == 400
+
+
+def test_get_snippet_conditional(fastapi_client, post_snippet, snippet_one):
+    post_snippet(snippet_one)
+    response = fastapi_client.get("/snippets/1")
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    response = fastapi_client.get("/snippets/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    response = fastapi_client.get(
+        "/snippets/1", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+    response = fastapi_client.get(
+        "/snippets/1?fields=title", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+    response = fastapi_client.post(
+        "/snippets/1/favorite", headers={"If-Match": '"stale"'}
+    )
+    assert response.status_code == 412
+    response = fastapi_client.post("/snippets/1/favorite", headers={"If-Match": etag})
+    assert response.status_code == 200
+    response = fastapi_client.get("/snippets/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_snippet_etag_matches_cached_body(
+    fastapi_client, post_snippet, snippet_one, test_async_engine
+):
+    post_snippet(snippet_one)
+    fastapi_client.post("/snippets/1/favorite")
+    cache = SnippetCache()
+
+    async def cached_repo():
+        async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
+            yield AsyncDatastoreRepository(
+                session, wrap=lambda repository: CachedRepository(repository, cache)
+            )
+
+    app.dependency_overrides[get_async_repo] = cached_repo
+    current = fastapi_client.get("/snippets/1").json()
+    # A row cached before the last write, whose invalidation has not landed.
+    created_at = datetime.fromisoformat(current["created_at"])
+    stale = {**current, "favorite": True, "updated_at": created_at}
+    cache.snippets.set(1, stale)
+    response = fastapi_client.get("/snippets/1")
+    assert response.json()["favorite"] is True
+    assert response.headers["ETag"] == snippet_etag(1, created_at)
+    cache.projections.set(1, {("id", "favorite", "updated_at"): stale})
+    response = fastapi_client.get("/snippets/1?fields=favorite")
+    assert response.json() == {"id": 1, "favorite": True}
+
+
+def test_get_snippets_conditional(fastapi_client, post_snippet, snippet_one):
+    post_snippet(snippet_one)
+    response = fastapi_client.get("/snippets/")
+    assert "Last-Modified" not in response.headers
+    response = fastapi_client.get(
+        "/snippets/", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert response.status_code == 304
+
+
+def test_get_changes(fastapi_client, post_snippet, snippet_one):
+    post_snippet(snippet_one)
+    fastapi_client.post("/snippets/1/favorite")
+    response = fastapi_client.get("/snippets/changes")
+    assert [change["op"] for change in response.json()["changes"]] == [
+        "add",
+        "favorite",
+    ]
+    assert response.json()["last_seq"] == 2
+    response = fastapi_client.get("/snippets/changes?since=2")
+    assert response.json() == {"changes": [], "last_seq": 2}
+
+
+@pytest.mark.anyio
+async def test_change_events():
+    class Feed:
+        releases = 0
+
+        async def changes(self, since, limit):
+            rows = [{"seq": 1, "snippet_id": 1, "op": "add"}]
+            return [row for row in rows if row["seq"] > since]
+
+        async def release(self):
+            self.releases += 1
+
+    polls = iter([False, False, True])
+
+    async def is_disconnected():
+        return next(polls)
+
+    feed = Feed()
+    events = [
+        event
+        async for event in change_events(feed, 0, is_disconnected, poll_interval=0)
+    ]
+    assert events == [
+        'id: 1\nevent: add\ndata: {"seq":1,"snippet_id":1,"op":"add"}\n\n'
+    ]
+    assert feed.releases == 2
+
+
+@pytest.mark.anyio
+async def test_change_events_release_connection(test_async_engine):
+    async with AsyncSession(test_async_engine) as session:
+        repo = AsyncDatastoreRepository(session)
+        polls = iter([False, True])
+
+        async def is_disconnected():
+            return next(polls)
+
+        async for _ in change_events(repo, 0, is_disconnected, poll_interval=0):
+            pass
+        assert not session.in_transaction()
+
+
+def test_metrics(fastapi_client, post_snippet, snippet_one):
+    post_snippet(snippet_one)
+    fastapi_client.get("/snippets/1")
+    response = fastapi_client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert (
+        'snipster_http_request_duration_seconds_count{method="GET",'
+        'route="/snippets/{snippet_id}",status="200"}'
+    ) in body
+    assert 'snipster_repository_duration_seconds_count{method="get_version"}' in body
+    assert (
+        'snipster_http_request_queries_count{method="POST",route="/snippets/"}' in body
+    )
+    assert "snipster_db_query_duration_seconds_count" in body
+    # The insert and its change-log row are attributed to the POST.
+    assert metrics.request_queries.series[("POST", "/snippets/")][-1] >= 2
+
+
+def test_get_snippets_filtered(fastapi_client, post_snippet, snippet_one):
+    for title, language, favorite in [
+        ("first", Language.PYTHON, True),
+        ("second", Language.RUST, False),
+        ("third", Language.PYTHON, False),
+    ]:
+        post_snippet(
+            snippet_one,
+            title=title,
+            code="pass",
+            language=language.value,
+            favorite=favorite,
+        )
+    response = fastapi_client.get("/snippets/?language=python&favorite=false")
+    assert [snippet["title"] for snippet in response.json()] == ["third"]
+    response = fastapi_client.get("/snippets/?sort=-id&limit=2")
+    assert [snippet["id"] for snippet in response.json()] == [3, 2]
+    cursor = response.headers["X-Next-Cursor"]
+    response = fastapi_client.get(f"/snippets/?sort=-id&cursor={cursor}")
+    assert [snippet["id"] for snippet in response.json()] == [1]
+    response = fastapi_client.get(f"/snippets/?sort=created_at&cursor={cursor}")
+    assert response.status_code == 400
+    response = fastapi_client.get("/snippets/?created_after=2999-01-01T00:00:00Z")
+    assert response.json() == []
+    assert fastapi_client.get("/snippets/?sort=title").status_code == 422
+    assert fastapi_client.get("/snippets/?language=cobol").status_code == 422
+
+
+def test_create_snippet_duplicate_policy(fastapi_client, post_snippet, snippet_one):
+    first = post_snippet(snippet_one)
+    assert first.status_code == 201
+    response = post_snippet(snippet_one, params={"on_duplicate": "reject"})
+    assert response.status_code == 409
+    response = post_snippet(
+        snippet_one,
+        params={"on_duplicate": "link"},
+        title="linked",
+        code=snippet_one.code + "  \n",
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == first.json()["id"]
+    assert response.json()["title"] == snippet_one.title
+
+    post_snippet(snippet_one)
+    response = fastapi_client.get("/snippets/duplicates")
+    assert response.json() == [
+        {"code_hash": first.json()["code_hash"], "count": 2, "ids": [1, 2]}
+    ]
+
+
+def test_get_similar_snippets(fastapi_client, post_snippet, snippet_one):
+    for code in ["def add(x, y):\n    return x + y", "def plus(a, b): return a+b"]:
+        post_snippet(snippet_one, code=code)
+    response = fastapi_client.get("/snippets/1/similar")
+    assert response.json() == [{"id": 2, "similarity": 1.0}]
+    assert fastapi_client.get("/snippets/99/similar").status_code == 404
+    assert fastapi_client.get("/snippets/1/similar?threshold=2").status_code == 422
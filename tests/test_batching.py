@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from snipster.batching import WriteBatcher
+from snipster.cache import _MISSING, CachedRepository, SnippetCache
+from snipster.exceptions import SnippetExists, SnippetNotFound, TagExists
+from snipster.models import Language, Snippet
+from snipster.repo import AsyncDatastoreRepository, DatastoreRepository
+
+
+def make_snippet(id):
+    return Snippet(
+        id=id,
+        title=f"snippet {id}",
+        code="pass",
+        description=None,
+        language=Language.PYTHON,
+        tags="batch",
+        favorite=False,
+    )
+
+
+@pytest.fixture
+def batcher(test_engine):
+    batcher = WriteBatcher(
+        lambda: Session(test_engine, expire_on_commit=False), max_delay=0.05
+    )
+    yield batcher
+    batcher.close()
+
+
+def test_write_batcher_group_commits(batcher, test_engine):
+    futures = [batcher.submit("add", make_snippet(id)) for id in (1, 2, 1, 3)]
+    futures.append(batcher.submit("delete", 99))
+
+    assert futures[0].result() == (
+        "Snippet ID: 1 was created and added to the Snippet Repository"
+    )
+    with pytest.raises(SnippetExists):
+        futures[2].result()
+    with pytest.raises(SnippetNotFound):
+        futures[4].result()
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["writes"] == 3
+
+    with Session(test_engine) as session:
+        repo = DatastoreRepository(session)
+        assert [row["id"] for row in repo.all()] == [1, 2, 3]
+        assert repo.tag_counts() == [{"tag": "batch", "count": 3}]
+
+
+def test_write_batcher_rolls_back_failed_tag_update(batcher, test_engine):
+    batcher.submit("add", make_snippet(1)).result()
+    failed = batcher.submit("update_tags", 1, "batch")
+    updated = batcher.submit("update_tags", 1, "extra")
+    with pytest.raises(TagExists):
+        failed.result()
+    assert updated.result()["tags"] == ["batch", "extra"]
+
+
+@pytest.mark.anyio
+async def test_async_repository_uses_batcher(batcher, test_async_engine):
+    async with AsyncSession(test_async_engine) as session:
+        repo = AsyncDatastoreRepository(session, batcher=batcher)
+        await asyncio.gather(*(repo.add(make_snippet(id)) for id in range(1, 6)))
+        assert batcher.stats()["batches"] == 1
+        assert len(await repo.all()) == 5
+        assert "favorite updated" in await repo.toggle_favorite(1)
+
+
+def test_write_batcher_invalidates_cache_after_commit(test_engine):
+    with Session(test_engine) as session:
+        DatastoreRepository(session).add(make_snippet(1))
+    cache = SnippetCache()
+    cache.snippets.set(1, {"id": 1, "favorite": False})
+    cached_before_commit = []
+
+    def session_factory():
+        session = Session(test_engine, expire_on_commit=False)
+        event.listen(
+            session,
+            "before_commit",
+            lambda session: cached_before_commit.append(
+                cache.snippets.get(1) is not _MISSING
+            ),
+        )
+        return session
+
+    batcher = WriteBatcher(
+        session_factory,
+        max_delay=0.01,
+        wrap=lambda repository: CachedRepository(repository, cache, deferred=True),
+    )
+    try:
+        batcher.submit("toggle_favorite", 1).result()
+    finally:
+        batcher.close()
+    assert cached_before_commit and all(cached_before_commit)
+    assert cache.snippets.get(1) is _MISSING
@@ -0,0 +1,39 @@
+import json
+
+from snipster.bench import compare, main, measure, percentile
+
+
+def test_percentile():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([7], 99) == 7
+
+
+def test_measure_counts_errors():
+    result = measure("double", lambda x: x * 2, [1, 2, 3], ok=lambda y: y < 5)
+    assert result["ops"] == 3
+    assert result["errors"] == 1
+
+
+def test_bench_report(tmp_path):
+    output = tmp_path / "report.json"
+    report = main(
+        [
+            "--size",
+            "5",
+            "--backend",
+            "memory",
+            "--backend",
+            "sqlite",
+            "--output",
+            str(output),
+        ]
+    )
+    assert json.loads(output.read_text())["size"] == 5
+    names = {(result["backend"], result["name"]) for result in report["results"]}
+    assert ("memory", "add") in names
+    assert ("sqlite", "delete") in names
+    assert all(result["p50_ms"] <= result["p99_ms"] for result in report["results"])
+    assert not any(result["errors"] for result in report["results"])
+    assert len(compare(report, report)) == len(report["results"])
@@ -0,0 +1,87 @@
+from snipster.cache import _MISSING, CachedRepository, LRUCache, SnippetCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is _MISSING
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 1, "evictions": 1}
+
+
+def test_lru_cache_expires_entries():
+    now = [0.0]
+    cache = LRUCache(max_size=10, ttl=5, clock=lambda: now[0])
+    cache.set("a", 1)
+    now[0] = 4.9
+    assert cache.get("a") == 1
+    now[0] = 5.0
+    assert cache.get("a") is _MISSING
+
+
+def test_cached_repository_get(repo_in_datastore, snippet_one):
+    repo = CachedRepository(repo_in_datastore, SnippetCache())
+    repo.add(snippet_one)
+    assert repo.get(1)["favorite"] is True
+    assert repo.get(1)["favorite"] is True
+    assert repo.cache.snippets.stats()["hits"] == 1
+
+    repo.toggle_favorite(1)
+    assert repo.get(1)["favorite"] is False
+
+
+def test_cached_repository_invalidates_listings(repo_in_datastore, snippet_one):
+    repo = CachedRepository(repo_in_datastore, SnippetCache())
+    assert repo.page(10) == ([], None)
+    repo.add(snippet_one)
+    assert len(repo.page(10)[0]) == 1
+    assert repo.tag_counts() == []
+    repo.update_tags(1, "python")
+    assert repo.tag_counts() == [{"tag": "python", "count": 1}]
+    repo.delete(1)
+    assert repo.page(10) == ([], None)
+    assert repo.get(1) is None
+
+
+def test_cached_repository_get_many(repo_in_datastore, snippet_one, snippet_two):
+    repo = CachedRepository(repo_in_datastore, SnippetCache())
+    repo.add(snippet_one)
+    repo.add(snippet_two)
+    repo.get(1)
+    items, missing = repo.get_many([1, 2, 3])
+    assert [item["id"] for item in items] == [1, 2]
+    assert missing == [3]
+    assert repo.cache.snippets.stats()["hits"] == 1
+    assert repo.get(2)["id"] == 2
+    assert repo.cache.snippets.stats()["hits"] == 2
+
+
+def test_cached_repository_scopes_listing_invalidation(repo_in_datastore, snippet_one):
+    repo = CachedRepository(repo_in_datastore, SnippetCache())
+    repo.add(snippet_one)
+    repo.update_tags(1, "python")
+    repo.tag_counts()
+    repo.page(10)
+    repo.toggle_favorite(1)
+    # A favorite flip cannot change tag counts, so that listing stays cached.
+    hits = repo.cache.listings.stats()["hits"]
+    assert repo.tag_counts() == [{"tag": "python", "count": 1}]
+    assert repo.cache.listings.stats()["hits"] == hits + 1
+    assert repo.page(10)[0][0]["favorite"] is False
+    assert repo.cache.listings.stats()["hits"] == hits + 1
+
+
+def test_cached_repository_caches_projections(repo_in_datastore, snippet_one):
+    repo = CachedRepository(repo_in_datastore, SnippetCache())
+    repo.add(snippet_one)
+    assert repo.get(1, columns=["id", "title"]) == {"id": 1, "title": "first snippet"}
+    assert repo.cache.snippets.get(1) is _MISSING
+    assert repo.get(1, columns=["id", "title"]) == {"id": 1, "title": "first snippet"}
+    assert repo.cache.projections.stats()["hits"] == 1
+    items, _ = repo.get_many([1], columns=["id", "title"])
+    assert items == [{"id": 1, "title": "first snippet"}]
+    assert repo.cache.projections.stats()["hits"] == 2
+    repo.toggle_favorite(1)
+    assert repo.get(1, columns=["id", "favorite"]) == {"id": 1, "favorite": False}
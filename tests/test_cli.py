@@ -1,6 +1,14 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
 from typer.testing import CliRunner
 
-from snipster.cli import app
+from snipster.cli import LANGUAGES, app
+from snipster.exceptions import DuplicateSnippet
+from snipster.models import Language
 
 runner = CliRunner()
 
@@ -175,3 +183,198 @@ def test_cli_tag_add(repo_in_datastore):
     )
     assert result.exit_code == 0
     assert result.output == "Tags ('print',) were removed from Snippet ID: 1\n"
+
+
+def test_cli_all_paginated(repo_in_datastore):
+    for title in ["first snippet", "second snippet"]:
+        runner.invoke(
+            app,
+            ["add", "--title", title, "--code", "pass", "--language", "python"],
+            obj=repo_in_datastore,
+        )
+    result = runner.invoke(app, ["all", "--limit", "1"], obj=repo_in_datastore)
+    assert result.exit_code == 0
+    assert "first snippet" in result.output
+    assert "second snippet" not in result.output
+    cursor = result.output.splitlines()[-1].removeprefix("Next cursor: ")
+    result = runner.invoke(
+        app, ["all", "--limit", "1", "--cursor", cursor], obj=repo_in_datastore
+    )
+    assert "second snippet" in result.output
+    assert "Next cursor" not in result.output
+    # A cursor without --limit still resumes after it.
+    result = runner.invoke(app, ["all", "--cursor", cursor], obj=repo_in_datastore)
+    assert "second snippet" in result.output
+    assert "first snippet" not in result.output
+
+
+def test_cli_all_filtered(repo_in_datastore):
+    for title, language in [("first snippet", "python"), ("second snippet", "rust")]:
+        runner.invoke(
+            app,
+            ["add", "--title", title, "--code", "pass", "--language", language],
+            obj=repo_in_datastore,
+        )
+    result = runner.invoke(app, ["all", "--language", "rust"], obj=repo_in_datastore)
+    assert result.exit_code == 0
+    assert "second snippet" in result.output
+    assert "first snippet" not in result.output
+    result = runner.invoke(
+        app, ["all", "--sort", "-id", "--limit", "1"], obj=repo_in_datastore
+    )
+    assert "second snippet" in result.output
+    result = runner.invoke(
+        app, ["all", "--created-after", "2999-01-01"], obj=repo_in_datastore
+    )
+    assert result.output.startswith("[]")
+    result = runner.invoke(app, ["all", "--no-favorite"], obj=repo_in_datastore)
+    assert "first snippet" in result.output
+    result = runner.invoke(app, ["all", "--sort", "title"], obj=repo_in_datastore)
+    assert result.exit_code != 0
+
+
+def test_cli_duplicates(repo_in_datastore):
+    add = ["add", "--title", "copy", "--code", "pass", "--language", "python"]
+    for _ in range(2):
+        runner.invoke(app, add, obj=repo_in_datastore)
+    with pytest.raises(DuplicateSnippet):
+        runner.invoke(app, [*add, "--on-duplicate", "reject"], obj=repo_in_datastore)
+    result = runner.invoke(app, [*add, "--on-duplicate", "link"], obj=repo_in_datastore)
+    assert "Snippet ID: 1 already has this code and was linked" in result.output
+    result = runner.invoke(app, ["duplicates"], obj=repo_in_datastore)
+    assert "'count': 2, 'ids': [1, 2]" in result.output
+
+
+def test_cli_similar(repo_in_datastore):
+    for code in ["def add(x, y): return x + y", "def plus(a, b): return a + b"]:
+        runner.invoke(
+            app,
+            ["add", "--title", "similar", "--code", code, "--language", "python"],
+            obj=repo_in_datastore,
+        )
+    result = runner.invoke(app, ["similar", "--id", "1"], obj=repo_in_datastore)
+    assert result.exit_code == 0
+    assert "[{'id': 2, 'similarity': 1.0}]" in result.output
+
+
+def test_cli_export(repo_in_datastore, tmp_path):
+    runner.invoke(
+        app,
+        ["add", "--title", "exported", "--code", "pass", "--language", "python"],
+        obj=repo_in_datastore,
+    )
+    result = runner.invoke(app, ["export"], obj=repo_in_datastore)
+    assert result.exit_code == 0
+    assert json.loads(result.output)["title"] == "exported"
+
+    output = tmp_path / "snippets.ndjson"
+    result = runner.invoke(
+        app, ["export", "--output", str(output)], obj=repo_in_datastore
+    )
+    assert result.exit_code == 0
+    assert json.loads(output.read_text())["title"] == "exported"
+
+
+def test_cli_import(repo_in_datastore, tmp_path):
+    source = tmp_path / "snippets.ndjson"
+    source.write_text(
+        '{"id": 5, "title": "restored", "code": "pass", "language": "python"}\n'
+        '{"title": "missing code", "language": "python"}\n'
+    )
+    result = runner.invoke(
+        app, ["import", "--input", str(source)], obj=repo_in_datastore
+    )
+    assert result.exit_code == 0
+    assert result.output.startswith("Imported 1 snippets\nRecord 1: code")
+    assert repo_in_datastore.get(5)["title"] == "restored"
+
+
+def test_cli_search(repo_in_datastore):
+    runner.invoke(
+        app,
+        [
+            "add",
+            "--title",
+            "regex helper",
+            "--code",
+            "re.compile",
+            "--language",
+            "python",
+        ],
+        obj=repo_in_datastore,
+    )
+    result = runner.invoke(app, ["search", "--query", "regex"], obj=repo_in_datastore)
+    assert result.exit_code == 0
+    assert "regex helper" in result.output
+
+
+def test_cli_tags(repo_in_datastore):
+    runner.invoke(
+        app,
+        ["add", "--title", "a", "--code", "pass", "--language", "go", "--tags", "web"],
+        obj=repo_in_datastore,
+    )
+    result = runner.invoke(app, ["tags"], obj=repo_in_datastore)
+    assert result.output == "[{'tag': 'web', 'count': 1}]\n"
+    result = runner.invoke(app, ["all", "--tag", "web"], obj=repo_in_datastore)
+    assert "'title': 'a'" in result.output
+
+
+def test_cli_languages_match_model():
+    assert LANGUAGES == [language.value for language in Language]
+
+
+def test_cli_imports_lazily():
+    code = (
+        "import sys, snipster.cli; "
+        "print(any(name in sys.modules for name in ('sqlalchemy', 'pydantic')))"
+    )
+    env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_cli_batch(repo_in_datastore):
+    commands = "\n".join(
+        [
+            "add --title one --code pass --language python",
+            "# comments and blank lines are skipped",
+            "",
+            "favorite --id 1",
+            "delete --id 7",
+            "get --id 1",
+        ]
+    )
+    result = runner.invoke(app, ["batch"], input=commands, obj=repo_in_datastore)
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert lines[0] == "Snippet ID: 1 was created and added to the Snippet Repository"
+    assert lines[1] == "Snippet ID: 1 favorite updated from False to True"
+    assert lines[2] == "Snippet ID: 7 not found"
+    assert "'favorite': True" in lines[3]
+
+
+def test_cli_shell(repo_in_datastore):
+    result = runner.invoke(
+        app,
+        ["shell"],
+        input="add --title one --code pass --language python\nget\nquit\nget --id 1\n",
+        obj=repo_in_datastore,
+    )
+    assert result.exit_code == 0
+    assert "Snippet ID: 1 was created" in result.output
+    assert "Missing option '--id'" in result.output
+    assert result.output.count("snipster> ") == 3
+
+
+def test_cli_batch_reports_unparsable_line(repo_in_datastore):
+    commands = (
+        "add --title 'one --code pass\nadd --title two --code pass --language go\n"
+    )
+    result = runner.invoke(app, ["batch"], input=commands, obj=repo_in_datastore)
+    assert result.exit_code == 1
+    lines = result.output.splitlines()
+    assert lines[0] == "Cannot parse line: No closing quotation"
+    assert "Snippet ID: 1 was created" in lines[1]
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+from snipster.conditional import etag_matches, http_date, not_modified, snippet_etag
+
+
+def test_snippet_etag_includes_columns():
+    updated_at = datetime(2025, 1, 2, 3, 4, 5, 6)
+    assert snippet_etag(1, updated_at) == snippet_etag(
+        1, updated_at.replace(tzinfo=timezone.utc)
+    )
+    assert snippet_etag(1, updated_at) != snippet_etag(1, updated_at, ["id"])
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert not etag_matches('W/"b"', '"b"', weak=False)
+    assert etag_matches("*", '"c"', weak=False)
+
+
+def test_not_modified():
+    updated_at = datetime(2025, 1, 2, 3, 4, 5, 600)
+    assert http_date(updated_at) == "Thu, 02 Jan 2025 03:04:05 GMT"
+    since = {"if-modified-since": "Thu, 02 Jan 2025 03:04:05 GMT"}
+    assert not_modified(since, '"a"', updated_at)
+    assert not not_modified({"if-modified-since": "garbage"}, '"a"', updated_at)
+    # If-None-Match wins over If-Modified-Since.
+    assert not not_modified({**since, "if-none-match": '"b"'}, '"a"', updated_at)
@@ -0,0 +1,12 @@
+from snipster.dedup import code_hash, normalize_code
+
+
+def test_normalize_code():
+    assert normalize_code("\n\nx = 1   \r\ny = 2\n\n") == "x = 1\ny = 2"
+    assert normalize_code("    indented\n") == "    indented"
+
+
+def test_code_hash():
+    assert code_hash("x = 1\n") == code_hash("x = 1  \r\n\n")
+    assert code_hash("x = 1") != code_hash("x = 2")
+    assert len(code_hash("x = 1")) == 32
@@ -0,0 +1,33 @@
+import logging
+
+from snipster import metrics
+from snipster.metrics import Histogram, finish_request, start_request
+
+
+def test_histogram_render():
+    histogram = Histogram("latency", "Latency", labels=("route",), buckets=(0.1, 1))
+    histogram.observe(0.1, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(3, "/a")
+    assert histogram.render() == [
+        "# HELP latency Latency",
+        "# TYPE latency histogram",
+        'latency_bucket{route="/a",le="0.1"} 1',
+        'latency_bucket{route="/a",le="1"} 2',
+        'latency_bucket{route="/a",le="+Inf"} 3',
+        'latency_sum{route="/a"} 3.6',
+        'latency_count{route="/a"} 3',
+    ]
+
+
+def test_slow_request_logged(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 0.5)
+    stats, token = start_request()
+    stats.queries = 4
+    with caplog.at_level(logging.WARNING, logger="snipster.slow_requests"):
+        finish_request(token, stats, "GET", "/slow", 200, 0.75)
+        stats, token = start_request()
+        finish_request(token, stats, "GET", "/fast", 200, 0.1)
+    assert len(caplog.records) == 1
+    assert '"route":"/slow"' in caplog.records[0].message
+    assert '"queries":4' in caplog.records[0].message
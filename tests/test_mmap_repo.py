@@ -0,0 +1,149 @@
+import pytest
+
+from snipster.exceptions import (
+    DuplicateSnippet,
+    InvalidCursor,
+    SnippetExists,
+    SnippetNotFound,
+)
+from snipster.mmap_repo import MmapRepository
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return tmp_path / "snippets"
+
+
+def test_mmap_repository_add_and_get(store_path, snippet_one, snippet_two):
+    with MmapRepository(store_path) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        assert (snippet_one.id, snippet_two.id) == (1, 2)
+        assert repo.get("1")["title"] == "first snippet"
+        assert repo.get(2, columns=["id", "language"]) == {
+            "id": 2,
+            "language": "python",
+        }
+        assert repo.get(3) is None
+        with pytest.raises(SnippetExists):
+            repo.add(snippet_one)
+
+
+def test_mmap_repository_persists_and_merges(store_path, snippet_one, snippet_two):
+    with MmapRepository(store_path, merge_every=2) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        assert repo.delta == {}
+        assert repo.count == 2
+        repo.toggle_favorite(2)
+        repo.tag(1, "python")
+
+    with MmapRepository(store_path) as repo:
+        assert (repo.count, repo.delta) == (2, {})
+        assert repo.get(2)["favorite"] is False
+        assert repo.get(1)["tags"] == "python"
+        repo.delete(1)
+        with pytest.raises(SnippetNotFound):
+            repo.delete(1)
+        repo.merge()
+
+    with MmapRepository(store_path) as repo:
+        assert [row["id"] for row in repo.stream()] == [2]
+        assert repo.add(snippet_one.model_copy(update={"id": None})) == (
+            "Snippet ID: 3 was created and added to the Snippet Repository"
+        )
+
+
+def test_mmap_repository_ignores_torn_log_entry(store_path, snippet_one):
+    with MmapRepository(store_path) as repo:
+        repo.add(snippet_one)
+    with open(f"{store_path}.log", "ab") as file:
+        file.write(b"\x01\x02\x03")
+    with MmapRepository(store_path) as repo:
+        assert [row["id"] for row in repo.all()] == [1]
+
+
+def test_mmap_repository_page_search_and_tags(store_path, snippet_one, snippet_two):
+    with MmapRepository(store_path, merge_every=2) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        repo.tag(1, "python", "basics")
+        repo.tag(2, "javascript", "basics")
+
+        items, cursor = repo.page(1)
+        assert [item["id"] for item in items] == [1]
+        items, cursor = repo.page(1, cursor=cursor)
+        assert [item["id"] for item in items] == [2]
+        assert cursor is None
+        items, _ = repo.page(10, tags=["python"])
+        assert [item["id"] for item in items] == [1]
+        with pytest.raises(InvalidCursor):
+            repo.page(1, cursor="bogus")
+
+        assert [row["id"] for row in repo.search("snippet", 10)] == [1, 2]
+        assert [row["id"] for row in repo.search("bulldogs", 10)] == [2]
+        assert repo.search("", 10) == []
+        assert repo.tag_counts()[0] == {"tag": "basics", "count": 2}
+        assert repo.get_many([2, 5]) == ([repo.get(2)], [5])
+
+
+def test_mmap_repository_page_filters(store_path, snippet_one, snippet_two):
+    snippet_two.favorite = False
+    with MmapRepository(store_path) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        items, _ = repo.page(10, favorite=False, language="python")
+        assert [item["id"] for item in items] == [2]
+        items, cursor = repo.page(1, sort="-id")
+        assert [item["id"] for item in items] == [2]
+        items, cursor = repo.page(1, cursor=cursor, sort="-id")
+        assert [item["id"] for item in items] == [1]
+        assert cursor is None
+        items, _ = repo.page(10, sort="-created_at")
+        assert [item["id"] for item in items] == [2, 1]
+
+
+def test_mmap_repository_duplicates(store_path, snippet_one, snippet_two):
+    snippet_two.code = snippet_one.code
+    with MmapRepository(store_path) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        assert repo.duplicates() == [
+            {"code_hash": snippet_one.code_hash, "count": 2, "ids": [1, 2]}
+        ]
+        with pytest.raises(DuplicateSnippet):
+            repo.add(snippet_two.model_copy(update={"id": None}), on_duplicate="reject")
+
+
+def test_mmap_repository_similar(store_path, snippet_one, snippet_two):
+    with MmapRepository(store_path, merge_every=2) as repo:
+        repo.add(snippet_one)
+        assert repo.similar(1) == []
+        snippet_two.code = "print('goodbye world')"
+        repo.add(snippet_two)
+        assert repo.band_delta == {}  # merged into the .bands file
+        repo.add(snippet_one.model_copy(update={"id": None, "title": "copy"}))
+        assert repo.similar(1) == [
+            {"id": 2, "similarity": 1.0},
+            {"id": 3, "similarity": 1.0},
+        ]
+        repo.delete(2)
+        assert repo.similar(1) == [{"id": 3, "similarity": 1.0}]
+        with pytest.raises(SnippetNotFound):
+            repo.similar(2)
+
+    with MmapRepository(store_path) as repo:
+        assert repo.similar("3") == [{"id": 1, "similarity": 1.0}]
+
+
+def test_mmap_repository_migrate_similarity(store_path, snippet_one, snippet_two):
+    with MmapRepository(store_path) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two.model_copy(update={"code": snippet_one.code}))
+    for suffix in (".sig", ".bands", ".bandlog"):
+        open(f"{store_path}{suffix}", "wb").close()
+
+    with MmapRepository(store_path) as repo:
+        assert repo.similar(1) == []
+        assert repo.migrate_similarity() == 2
+        assert repo.similar(1) == [{"id": 2, "similarity": 1.0}]
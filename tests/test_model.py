@@ -1,4 +1,17 @@
-from snipster.models import Language, Snippet
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.schema import CreateTable
+
+from snipster.models import (
+    Language,
+    Snippet,
+    SnippetChange,
+    _pool_stats,
+    dispose_engine,
+    get_engine,
+    pool_options,
+)
 
 
 def test_snippet(session):
@@ -18,3 +31,36 @@ def test_snippet(session):
     assert snippet.language.value == "python"
     assert snippet.created_at is not None
     assert snippet.updated_at is not None
+
+
+def test_get_engine_is_shared():
+    engine = get_engine()
+    assert get_engine() is engine
+    dispose_engine()
+    assert get_engine() is not engine
+    dispose_engine()
+
+
+def test_timestamps_are_timezone_aware_on_postgres():
+    # asyncpg refuses aware datetimes for TIMESTAMP WITHOUT TIME ZONE.
+    for table in (Snippet.__table__, SnippetChange.__table__):
+        ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+        assert "created_at TIMESTAMP WITH TIME ZONE" in ddl
+    ddl = str(CreateTable(Snippet.__table__).compile(dialect=postgresql.dialect()))
+    assert "updated_at TIMESTAMP WITH TIME ZONE" in ddl
+
+
+def test_pool_options_only_for_queue_pools():
+    assert pool_options("sqlite://") == {}
+    assert pool_options("sqlite+aiosqlite:///:memory:") == {}
+    assert "pool_size" in pool_options("sqlite:///snipster.db")
+    assert "pool_size" in pool_options("postgresql+asyncpg://user@host/db")
+
+
+def test_pool_stats_without_queue_pool(tmp_path):
+    assert _pool_stats(create_engine("sqlite://").pool) == {}
+    assert _pool_stats(create_engine("sqlite://", poolclass=StaticPool).pool) == {}
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=NullPool)
+    assert _pool_stats(engine.pool) == {}
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db")
+    assert _pool_stats(engine.pool)["checked_out"] == 0
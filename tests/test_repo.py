@@ -1,15 +1,32 @@
 import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
 
 import pytest
+from sqlalchemy import event, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from snipster.dedup import code_hash
 from snipster.exceptions import (
+    DuplicateSnippet,
+    InvalidCursor,
     NoTagsPresent,
     SnippetExists,
     SnippetNotFound,
     TagExists,
     TagNotFound,
+    VersionConflict,
+)
+from snipster.models import Language, Snippet
+from snipster.repo import (
+    AsyncDatastoreRepository,
+    DatastoreRepository,
+    InMemoryRepository,
+    JournaledJSONRepository,
+    JSONRepository,
+    SnippetRecord,
+    parse_tags,
 )
-from snipster.repo import JSONRepository
 
 
 def test_in_memory_add(repo_in_memory, snippet_one):
@@ -61,6 +78,62 @@ def test_datastore_add_error(repo_in_datastore, snippet_one):
         repo_in_datastore.add(snippet_one)
 
 
+def test_datastore_add_explicit_then_generated_id(
+    repo_in_datastore, snippet_one, snippet_two
+):
+    snippet_one.id = 5
+    repo_in_datastore.add(snippet_one)
+    result = repo_in_datastore.add(snippet_two)
+    assert result == "Snippet ID: 6 was created and added to the Snippet Repository"
+
+
+def test_datastore_advance_sequence_only_moves_forward():
+    class Session:
+        statements = []
+
+        def get_bind(self):
+            return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+        def execute(self, statement):
+            self.statements.append(str(statement))
+
+            class Result:
+                def scalar(self):
+                    return "public.snippet_id_seq"
+
+            return Result()
+
+    DatastoreRepository(Session())._advance_sequence()
+    assert Session.statements[-1] == (
+        "SELECT setval('public.snippet_id_seq', GREATEST("
+        "(SELECT max(id) FROM snippet), "
+        "(SELECT last_value FROM public.snippet_id_seq)))"
+    )
+
+
+def test_datastore_add_without_select(repo_in_datastore, test_engine, snippet_one):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        repo_in_datastore.add(snippet_one)
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+    # Inserts for the row, its MinHash signature and LSH bands and its
+    # change-log entry; no SELECTs.
+    assert [statement.split(" (")[0] for statement in statements] == [
+        "INSERT INTO snippet",
+        "INSERT INTO snippetsignature",
+        "INSERT INTO snippetband",
+        "INSERT INTO snippetchange",
+    ]
+    assert snippet_one.id == 1
+    assert repo_in_datastore.get(1)["title"] == "first snippet"
+
+
 def test_datastore_get_all(repo_in_datastore, snippet_one, snippet_two):
     repo_in_datastore.add(snippet_one)
     repo_in_datastore.add(snippet_two)
@@ -148,6 +221,21 @@ def test_datastore_toggle_favorite_error(repo_in_datastore):
         repo_in_datastore.toggle_favorite(100)
 
 
+def test_datastore_expected_version(repo_in_datastore, snippet_one):
+    repo_in_datastore.add(snippet_one)
+    version = repo_in_datastore.get_version(1)
+    repo_in_datastore.toggle_favorite(1, expected_version=version)
+    # The first write moved the version on, so a second one holding the same
+    # ETag must fail instead of overwriting it.
+    with pytest.raises(VersionConflict):
+        repo_in_datastore.update_tags(1, "python", expected_version=version)
+    with pytest.raises(VersionConflict):
+        repo_in_datastore.delete(1, expected_version=version)
+    assert repo_in_datastore.get(1)["favorite"] is False
+    repo_in_datastore.delete(1, expected_version=repo_in_datastore.get_version(1))
+    assert repo_in_datastore.get(1) is None
+
+
 def test_json_repository_toggle_favorite(temp_json_file, snippet_one, snippet_two):
     snippet_one.id = 10
     snippet_two.id = 20
@@ -234,3 +322,551 @@ def test_datastore_remove_tag_error(repo_in_datastore, snippet_one):
 
     with pytest.raises(NoTagsPresent):
         repo_in_datastore.tag(1, "python", remove=True)
+
+
+def test_in_memory_page(snippet_one, snippet_two):
+    repo = InMemoryRepository()
+    for id, snippet in enumerate([snippet_one, snippet_two], start=1):
+        snippet.id = id
+        repo.add(snippet)
+    first, cursor = repo.page(1)
+    assert first[0]["title"] == "first snippet"
+    second, cursor = repo.page(1, cursor=cursor)
+    assert second[0]["title"] == "second snippet"
+    assert cursor is None
+
+
+def test_datastore_page(repo_in_datastore, snippet_one, snippet_two):
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add(snippet_two)
+    first, cursor = repo_in_datastore.page(1)
+    assert [row["id"] for row in first] == [1]
+    second, cursor = repo_in_datastore.page(1, cursor=cursor)
+    assert [row["id"] for row in second] == [2]
+    assert cursor is None
+
+
+def test_datastore_page_invalid_cursor(repo_in_datastore):
+    with pytest.raises(InvalidCursor):
+        repo_in_datastore.page(10, cursor="not-a-cursor")
+
+
+def test_datastore_add_many(repo_in_datastore, snippet_one, snippet_two):
+    repo_in_datastore.add(snippet_one)
+    duplicate = Snippet(**snippet_two.model_dump())
+    duplicate.id = 1
+    results = repo_in_datastore.add_many([snippet_two, duplicate])
+    assert results == [
+        {"id": 2},
+        {"error": "Snippet ID: 1 already exists"},
+    ]
+    assert len(repo_in_datastore.all()) == 2
+
+
+def test_datastore_add_many_mixed_ids(repo_in_datastore, snippet_one, snippet_two):
+    snippet_two.id = 1
+    results = repo_in_datastore.add_many([snippet_one, snippet_two])
+    assert results == [{"id": 2}, {"id": 1}]
+    assert [row["title"] for row in repo_in_datastore.page(10)[0]] == [
+        "second snippet",
+        "first snippet",
+    ]
+
+
+def test_in_memory_search(snippet_one, snippet_two):
+    repo = InMemoryRepository()
+    for id, snippet in enumerate([snippet_one, snippet_two], start=1):
+        snippet.id = id
+        repo.add(snippet)
+    assert [row["id"] for row in repo.search("bulldogs", 10)] == [2]
+    assert [row["id"] for row in repo.search("snippet print", 10)] == [1, 2]
+    repo.delete("2")
+    assert repo.search("bulldogs", 10) == []
+
+
+def test_datastore_search(repo_in_datastore, snippet_one, snippet_two):
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add(snippet_two)
+    assert [row["id"] for row in repo_in_datastore.search("bulldogs", 10)] == [2]
+    assert len(repo_in_datastore.search("snippet", 10)) == 2
+    assert len(repo_in_datastore.search("snippet", 10, offset=1)) == 1
+    assert repo_in_datastore.search("!!!", 10) == []
+    repo_in_datastore.delete(2)
+    assert repo_in_datastore.search("bulldogs", 10) == []
+
+
+def test_json_repository_search(temp_json_file, snippet_one):
+    snippet_one.id = 1
+    with JSONRepository(temp_json_file) as repo:
+        repo.add(snippet_one)
+
+    with JSONRepository(temp_json_file) as repo:
+        assert [row["title"] for row in repo.search("hello", 10)] == ["first snippet"]
+
+
+def test_parse_tags():
+    assert parse_tags("python, sql,python ,") == ["python", "sql"]
+    assert parse_tags(None) == []
+
+
+def test_datastore_page_by_tag(repo_in_datastore, snippet_one, snippet_two):
+    snippet_one.tags = "python, print"
+    snippet_two.tags = "python"
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add(snippet_two)
+    repo_in_datastore.tag(2, "dogs")
+
+    def ids(tags, match):
+        rows, _ = repo_in_datastore.page(10, tags=tags, match=match)
+        return [row["id"] for row in rows]
+
+    assert ids(["python"], "all") == [1, 2]
+    assert ids(["python", "print"], "all") == [1]
+    assert ids(["print", "dogs"], "any") == [1, 2]
+    assert ids(["print", "dogs"], "all") == []
+
+    repo_in_datastore.tag(1, "print", remove=True)
+    assert ids(["print"], "any") == []
+    repo_in_datastore.delete(2)
+    assert repo_in_datastore.tag_counts() == [{"tag": "python", "count": 1}]
+
+
+def test_datastore_tag_counts(repo_in_datastore, snippet_one, snippet_two):
+    snippet_one.tags = "python, print"
+    snippet_two.tags = "python"
+    repo_in_datastore.add_many([snippet_one, snippet_two])
+    assert repo_in_datastore.tag_counts() == [
+        {"tag": "python", "count": 2},
+        {"tag": "print", "count": 1},
+    ]
+
+
+def test_datastore_migrate_tags(repo_in_datastore, session, snippet_one):
+    snippet_one.tags = "python, legacy"
+    session.add(snippet_one)
+    session.commit()
+    assert repo_in_datastore.tag_counts() == []
+    assert repo_in_datastore.migrate_tags() == 1
+    assert {row["tag"] for row in repo_in_datastore.tag_counts()} == {
+        "python",
+        "legacy",
+    }
+
+
+def test_in_memory_page_by_tag(snippet_one, snippet_two):
+    repo = InMemoryRepository()
+    snippet_one.id, snippet_one.tags = 1, "python, print"
+    snippet_two.id, snippet_two.tags = 2, "python"
+    repo.add(snippet_one)
+    repo.add(snippet_two)
+    rows, _ = repo.page(10, tags=["print"])
+    assert [row["id"] for row in rows] == [1]
+    rows, _ = repo.page(10, tags=["print", "python"], match="any")
+    assert [row["id"] for row in rows] == [1, 2]
+    assert repo.tag_counts()[0] == {"tag": "python", "count": 2}
+
+
+def test_datastore_update_tags(repo_in_datastore, snippet_one):
+    repo_in_datastore.add(snippet_one)
+    result = repo_in_datastore.update_tags(1, "python, json")
+    assert result == {
+        "message": "Tags ('python, json',) were added for Snippet ID: 1",
+        "tags": ["python", "json"],
+    }
+    with pytest.raises(TagExists):
+        repo_in_datastore.update_tags(1, "python")
+    result = repo_in_datastore.update_tags(1, "python", remove=True)
+    assert result["tags"] == ["json"]
+    assert repo_in_datastore.get(1)["tags"] == "json"
+
+
+def test_datastore_update_tags_parses_lists(repo_in_datastore, session, snippet_one):
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.update_tags(1, "python")
+    with pytest.raises(TagExists):
+        repo_in_datastore.update_tags(1, "python, new")
+    assert repo_in_datastore.update_tags(1, "new,other")["tags"] == [
+        "python",
+        "new",
+        "other",
+    ]
+    with pytest.raises(TagNotFound):
+        repo_in_datastore.update_tags(1, "new, missing", remove=True)
+    result = repo_in_datastore.update_tags(1, "python,  new", remove=True)
+    assert result["tags"] == ["other"]
+    assert repo_in_datastore.get(1)["tags"] == "other"
+    linked = session.execute(text("SELECT count(*) FROM snippettag")).scalar()
+    assert linked == 1
+
+
+def test_datastore_update_tags_not_found(repo_in_datastore):
+    with pytest.raises(SnippetNotFound):
+        repo_in_datastore.update_tags(100, "python")
+
+
+def test_in_memory_update_tags(snippet_one):
+    repo = InMemoryRepository()
+    snippet_one.id = 1
+    repo.add(snippet_one)
+    assert repo.update_tags("1", "rust")["tags"] == ["rust"]
+
+
+@pytest.mark.anyio
+async def test_async_datastore_repository(test_async_engine, snippet_one):
+    async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
+        repo = AsyncDatastoreRepository(session)
+        result = await repo.add(snippet_one)
+        assert result == "Snippet ID: 1 was created and added to the Snippet Repository"
+        assert (await repo.get(1))["title"] == "first snippet"
+        assert (await repo.update_tags(1, "python"))["tags"] == ["python"]
+        rows, cursor = await repo.page(10, tags=["python"])
+        assert [row["id"] for row in rows] == [1]
+        with pytest.raises(SnippetNotFound):
+            await repo.delete(2)
+
+
+def test_in_memory_get_many(snippet_one):
+    repo = InMemoryRepository()
+    snippet_one.id = 1
+    repo.add(snippet_one)
+    items, missing = repo.get_many(["1", "7", "1"])
+    assert [item["title"] for item in items] == ["first snippet"]
+    assert missing == ["7"]
+
+
+def test_datastore_get_many(repo_in_datastore, snippet_one, snippet_two):
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add(snippet_two)
+    items, missing = repo_in_datastore.get_many([2, 5, 1])
+    assert [item["id"] for item in items] == [2, 1]
+    assert missing == [5]
+
+
+def test_datastore_columns(repo_in_datastore, snippet_one, snippet_two):
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add(snippet_two)
+    columns = ["id", "title"]
+    assert repo_in_datastore.get(1, columns=columns) == {
+        "id": 1,
+        "title": "first snippet",
+    }
+    rows, cursor = repo_in_datastore.page(1, columns=columns)
+    assert rows == [{"id": 1, "title": "first snippet"}]
+    rows, _ = repo_in_datastore.page(1, cursor=cursor, columns=["id"])
+    assert rows == [{"id": 2}]
+    items, missing = repo_in_datastore.get_many([2, 3], columns=columns)
+    assert items == [{"id": 2, "title": "second snippet"}]
+
+
+def test_in_memory_columns(snippet_one):
+    repo = InMemoryRepository()
+    snippet_one.id = 1
+    repo.add(snippet_one)
+    assert repo.get("1", columns=["id", "code"]) == {
+        "id": 1,
+        "code": "print('hello world')",
+    }
+
+
+def test_journaled_json_repository_replays_journal(temp_json_file, snippet_one):
+    snippet_one.id = 1
+    with JournaledJSONRepository(temp_json_file) as repo:
+        repo.add(snippet_one)
+        repo.toggle_favorite("1")
+        repo.tag("1", "python")
+
+    assert json.loads(temp_json_file.read_text()) == {}
+    with JournaledJSONRepository(temp_json_file) as repo:
+        assert repo.journal_entries == 3
+        assert repo.get("1")["favorite"] is False
+        assert repo.get("1")["tags"] == "python"
+        assert [row["id"] for row in repo.search("hello", 10)] == [1]
+        repo.delete("1")
+
+    with JournaledJSONRepository(temp_json_file) as repo:
+        assert repo.all() == []
+
+
+def test_journaled_json_repository_compacts(temp_json_file, snippet_one, snippet_two):
+    snippet_one.id = 1
+    snippet_two.id = 2
+    with JournaledJSONRepository(temp_json_file, compact_every=2) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        assert repo.journal_entries == 0
+        repo.toggle_favorite("2")
+
+    assert set(json.loads(temp_json_file.read_text())) == {"1", "2"}
+    journal = temp_json_file.parent / "test.json.journal"
+    assert len(journal.read_text().splitlines()) == 1
+
+    with open(journal, "a") as file:
+        file.write('{"op": "delete", "id"')
+    with JournaledJSONRepository(temp_json_file) as repo:
+        assert repo.get("2")["favorite"] is False
+        repo.delete("1")
+    with JournaledJSONRepository(temp_json_file) as repo:
+        assert list(repo.repository) == ["2"]
+
+
+def test_snippet_record(snippet_one):
+    snippet_one.id = 1
+    record = SnippetRecord(snippet_one.model_dump())
+    assert record == snippet_one.model_dump()
+    assert record.get("tags", "") is None
+    record["tags"] = "python"
+    assert dict(record)["tags"] == "python"
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(KeyError):
+        record["missing"] = True
+
+
+def test_in_memory_secondary_indexes(temp_json_file, snippet_one, snippet_two):
+    snippet_one.tags = "python, print"
+    with JSONRepository(temp_json_file) as repo:
+        repo.add(snippet_one)
+        repo.add(snippet_two)
+        assert (snippet_one.id, snippet_two.id) == (1, 2)
+        repo.toggle_favorite("2")
+        repo.tag("2", "python")
+        assert repo.by_favorite == {True: {1}, False: {2}}
+        assert repo.by_tag == {"python": {1, 2}, "print": {1}}
+
+    with JSONRepository(temp_json_file) as repo:
+        assert repo.by_language == {"python": {1, 2}}
+        assert repo.by_tag == {"python": {1, 2}, "print": {1}}
+        repo.tag("1", "print", remove=True)
+        repo.delete("2")
+        assert repo.ids == [1]
+        assert repo.by_tag == {"python": {1}}
+        assert repo.tag_counts() == [{"tag": "python", "count": 1}]
+
+
+def test_datastore_changes(repo_in_datastore, snippet_one, snippet_two):
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add_many([snippet_two])
+    repo_in_datastore.toggle_favorite(1)
+    repo_in_datastore.update_tags(2, "python")
+    repo_in_datastore.delete(1)
+    changes = repo_in_datastore.changes()
+    assert [(row["snippet_id"], row["op"]) for row in changes] == [
+        (1, "add"),
+        (2, "add"),
+        (1, "favorite"),
+        (2, "tags"),
+        (1, "delete"),
+    ]
+    assert [row["seq"] for row in changes] == [1, 2, 3, 4, 5]
+    assert [row["seq"] for row in repo_in_datastore.changes(since=3, limit=1)] == [4]
+
+
+def _filter_corpus():
+    created = [datetime(2024, 1, day, tzinfo=timezone.utc) for day in (3, 1, 2)]
+    return [
+        Snippet(
+            id=id,
+            title=f"snippet {id}",
+            code="pass",
+            description=None,
+            language=language,
+            tags=None,
+            favorite=favorite,
+            created_at=created_at,
+            updated_at=created_at,
+        )
+        for id, language, favorite, created_at in zip(
+            (1, 2, 3),
+            (Language.PYTHON, Language.RUST, Language.PYTHON),
+            (True, False, False),
+            created,
+        )
+    ]
+
+
+@pytest.mark.parametrize("backend", ["memory", "datastore"])
+def test_page_filters_and_sort(backend, request):
+    if backend == "memory":
+        repo = InMemoryRepository()
+    else:
+        repo = request.getfixturevalue("repo_in_datastore")
+    for snippet in _filter_corpus():
+        repo.add(snippet)
+
+    def ids(**kwargs):
+        rows, _ = repo.page(10, **kwargs)
+        return [row["id"] for row in rows]
+
+    assert ids(language="python") == [1, 3]
+    assert ids(language=Language.RUST) == [2]
+    assert ids(favorite=True) == [1]
+    assert ids(favorite=False, language="python") == [3]
+    assert ids(created_after=datetime(2024, 1, 1, 12)) == [1, 3]
+    assert ids(updated_after="2024-01-02T00:00:00+00:00") == [1]
+    assert ids(sort="-id") == [3, 2, 1]
+    assert ids(sort="created_at") == [2, 3, 1]
+    assert ids(sort="-updated_at", language="python") == [1, 3]
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = repo.page(1, cursor=cursor, sort="-created_at", columns=["id"])
+        assert list(rows[0]) == ["id"]
+        seen.extend(row["id"] for row in rows)
+        if cursor is None:
+            break
+    assert seen == [1, 3, 2]
+    _, cursor = repo.page(1, sort="created_at")
+    with pytest.raises(InvalidCursor):
+        repo.page(1, cursor=cursor, sort="id")
+
+
+def test_datastore_listing_indexes(repo_in_datastore, session):
+    plan = session.execute(
+        text(
+            "EXPLAIN QUERY PLAN SELECT id FROM snippet "
+            "WHERE language = 'PYTHON' ORDER BY id"
+        )
+    ).all()
+    assert "ix_snippet_language_id" in str(plan)
+    plan = session.execute(
+        text("EXPLAIN QUERY PLAN SELECT id FROM snippet WHERE favorite ORDER BY id")
+    ).all()
+    assert "ix_snippet_favorite_id" in str(plan)
+
+
+def _copies(count, code="print('boilerplate')"):
+    return [
+        Snippet(
+            title=f"copy {index}",
+            code=code if index else f"{code}  \n",
+            description=None,
+            language=Language.PYTHON,
+            tags=None,
+            favorite=False,
+        )
+        for index in range(count)
+    ]
+
+
+def test_in_memory_duplicates_share_code(snippet_one):
+    repo = InMemoryRepository()
+    first, second, third = _copies(3)
+    third.code = "".join(second.code)  # equal text, separate string object
+    repo.add(first)
+    repo.add(second)
+    repo.add(third)
+    repo.add(snippet_one)
+    assert first.code_hash == second.code_hash
+    # Near-copies keep their own text; exact copies share one string.
+    assert repo.get("1")["code"] == first.code
+    assert repo.get("2")["code"] == second.code != first.code
+    assert repo.get("2")["code"] is repo.get("3")["code"]
+    assert repo.duplicates() == [
+        {"code_hash": first.code_hash, "count": 3, "ids": [1, 2, 3]}
+    ]
+    repo.delete("1")
+    repo.delete("2")
+    assert first.code not in repo.codes
+    assert second.code in repo.codes
+    repo.delete("3")
+    assert second.code not in repo.codes
+    assert repo.duplicates() == []
+
+
+@pytest.mark.parametrize("backend", ["memory", "datastore"])
+def test_add_duplicate_policy(backend, request):
+    if backend == "memory":
+        repo = InMemoryRepository()
+    else:
+        repo = request.getfixturevalue("repo_in_datastore")
+    original, rejected, linked = _copies(3)
+    repo.add(original)
+    with pytest.raises(DuplicateSnippet) as error:
+        repo.add(rejected, on_duplicate="reject")
+    assert error.value.snippet_id == original.id
+    message = repo.add(linked, on_duplicate="link")
+    assert linked.id == original.id
+    assert message == f"Snippet ID: {original.id} already has this code and was linked"
+    rows, _ = repo.page(10)
+    assert len(rows) == 1
+
+
+def test_datastore_duplicates(repo_in_datastore, snippet_one):
+    copies = _copies(3)
+    repo_in_datastore.add_many(copies[:2])
+    repo_in_datastore.add(copies[2])
+    repo_in_datastore.add(snippet_one)
+    assert repo_in_datastore.duplicates() == [
+        {"code_hash": copies[0].code_hash, "count": 3, "ids": [1, 2, 3]}
+    ]
+    assert repo_in_datastore.duplicates(limit=0) == []
+
+
+def test_datastore_migrate_code_hashes(repo_in_datastore, session, snippet_one):
+    repo_in_datastore.add(snippet_one)
+    session.execute(text("UPDATE snippet SET code_hash = NULL"))
+    assert repo_in_datastore.migrate_code_hashes() == 1
+    assert repo_in_datastore.get(1)["code_hash"] == code_hash(snippet_one.code)
+
+
+@pytest.mark.parametrize("backend", ["memory", "datastore"])
+def test_similar(backend, request):
+    if backend == "memory":
+        repo = InMemoryRepository()
+    else:
+        repo = request.getfixturevalue("repo_in_datastore")
+    for code in (
+        "def add(x, y):\n    return x + y\n",
+        "def plus(a, b):\n  return a+b",
+        "SELECT name FROM users WHERE id = 1",
+    ):
+        repo.add(
+            Snippet(
+                title="similar",
+                code=code,
+                description=None,
+                language=Language.PYTHON,
+                tags=None,
+                favorite=False,
+            )
+        )
+    assert repo.similar(1) == [{"id": 2, "similarity": 1.0}]
+    assert repo.similar(3) == []
+    repo.delete(2 if backend == "datastore" else "2")
+    assert repo.similar(1) == []
+    with pytest.raises(SnippetNotFound):
+        repo.similar(2)
+
+
+def test_in_memory_similarity_index_is_lazy(snippet_one):
+    repo = InMemoryRepository()
+    first, second = _copies(2)
+    repo.add(first)
+    repo.add(second)
+    assert repo.similarity is None
+    assert repo.similar(1) == [{"id": 2, "similarity": 1.0}]
+    assert all(isinstance(data, bytes) for data in repo.similarity.signatures.values())
+    # Once built, the index follows later adds.
+    repo.add(_copies(3)[2])
+    assert [match["id"] for match in repo.similar(1)] == [2, 3]
+
+
+def test_datastore_similar_bounds_candidates(
+    repo_in_datastore, snippet_one, monkeypatch
+):
+    monkeypatch.setattr("snipster.repo.MAX_CANDIDATES", 1)
+    for title in ("first", "second", "third"):
+        repo_in_datastore.add(
+            snippet_one.model_copy(update={"id": None, "title": title})
+        )
+    assert repo_in_datastore.similar(1) == [{"id": 2, "similarity": 1.0}]
+
+
+def test_datastore_migrate_similarity(repo_in_datastore, session, snippet_one):
+    snippet_two = snippet_one.model_copy(update={"id": None, "title": "copy"})
+    repo_in_datastore.add(snippet_one)
+    repo_in_datastore.add(snippet_two)
+    session.execute(text("DELETE FROM snippetband"))
+    session.execute(text("DELETE FROM snippetsignature"))
+    assert repo_in_datastore.similar(1) == []
+    assert repo_in_datastore.migrate_similarity() == 2
+    assert repo_in_datastore.similar(1) == [{"id": 2, "similarity": 1.0}]
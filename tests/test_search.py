@@ -0,0 +1,25 @@
+from snipster.search import InvertedIndex, tokenize
+
+
+def test_tokenize():
+    assert tokenize("Hello, World_2!") == ["hello", "world_2"]
+    assert tokenize(None) == []
+
+
+def test_inverted_index_ranks_matches():
+    index = InvertedIndex()
+    index.add(1, "parse json", None, "json.loads(text)")
+    index.add(2, "parse yaml", "not json at all", "yaml.safe_load(text)")
+    index.add(3, "sql query", None, "select 1")
+    assert index.search("json", limit=10) == [1, 2]
+    assert index.search("parse json", limit=10) == [1, 2]
+    assert index.search("parse json", limit=1, offset=1) == [2]
+    assert index.search("missing", limit=10) == []
+
+
+def test_inverted_index_remove():
+    index = InvertedIndex()
+    index.add(1, "parse json", None, "")
+    index.remove(1)
+    assert index.search("json", limit=10) == []
+    assert index.postings == {}
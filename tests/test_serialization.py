@@ -0,0 +1,21 @@
+from datetime import datetime
+
+import pytest
+
+from snipster.models import Language
+from snipster.repo import SnippetRecord
+from snipster.serialization import dumps, loads
+
+
+def test_dumps_snippet_values(snippet_one):
+    snippet_one.id = 1
+    snippet_one.created_at = datetime(2025, 1, 2, 3, 4, 5)
+    row = loads(dumps(SnippetRecord(snippet_one.model_dump())))
+    assert row["language"] == Language.PYTHON.value
+    assert row["created_at"] == "2025-01-02T03:04:05"
+    assert row["title"] == "first snippet"
+
+
+def test_dumps_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
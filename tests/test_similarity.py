@@ -0,0 +1,37 @@
+from snipster.similarity import (
+    BANDS,
+    LSHIndex,
+    band_keys,
+    code_tokens,
+    estimate,
+    signature,
+)
+
+ADD = "def add(x, y):\n    return x + y\n"
+RENAMED = "def plus(first, second):\n  return first+second"
+QUERY = "SELECT name FROM users WHERE id = 1 ORDER BY name"
+
+
+def test_code_tokens_collapse_identifiers():
+    assert code_tokens("return total + 1") == ["return", "$", "+", "1"]
+    assert code_tokens(ADD) == code_tokens(RENAMED)
+
+
+def test_signature():
+    assert signature("") is None
+    assert signature(ADD) == signature(RENAMED)
+    assert estimate(signature(ADD), signature(QUERY)) < 0.5
+    assert len(list(band_keys(signature(ADD)))) == BANDS
+
+
+def test_lsh_index():
+    index = LSHIndex()
+    index.add(1, signature(ADD))
+    index.add(2, signature(RENAMED))
+    index.add(3, signature(QUERY))
+    index.add(4, signature(""))
+    assert index.similar(1, 10) == [{"id": 2, "similarity": 1.0}]
+    assert index.similar(4, 10) == []
+    index.remove(2)
+    assert index.similar(1, 10) == []
+    assert all(2 not in bucket for bucket in index.buckets.values())
@@ -0,0 +1,29 @@
+from snipster.repo import InMemoryRepository
+from snipster.transfer import import_snippets, read_records, to_ndjson
+
+
+def test_read_records_json_array():
+    records = list(read_records(['[{"title": "a"},\n', ' {"title": "b"}]\n']))
+    assert records == [(0, {"title": "a"}), (1, {"title": "b"})]
+
+
+def test_read_records_ndjson():
+    records = list(read_records(['{"title": "a"}\n', "\n", "{oops\n"]))
+    assert records[0] == (0, {"title": "a"})
+    assert records[1][0] == 1
+    assert isinstance(records[1][1], ValueError)
+
+
+def test_import_snippets_chunks():
+    repo = InMemoryRepository()
+    records = [
+        (index, {"id": index, "title": "t", "code": "c", "language": "rust"})
+        for index in range(1, 6)
+    ]
+    report = import_snippets(repo, records, chunk_size=2)
+    assert report == {"created": [1, 2, 3, 4, 5], "errors": []}
+
+
+def test_to_ndjson_chunks():
+    chunks = list(to_ndjson([{"id": 1}, {"id": 2}, {"id": 3}], chunk_size=2))
+    assert chunks == ['{"id":1}\n{"id":2}\n', '{"id":3}\n']